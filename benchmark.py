@@ -0,0 +1,280 @@
+'''
+Offline throughput benchmark for the Executive. A fixed, generated corpus of HTML pages is served from a local
+http.server, then every case runs in a fresh interpreter so its peak RSS is its own. Each getter case fetches
+every page once with a cold Executive; the crawl case runs Executive.crawl over all pages. No network access is
+needed.
+
+python benchmark.py [--pages N] [--rounds N] [--cases getEmails,crawl] [--output FILE] [--baseline FILE]
+                    [--tolerance 0.15]
+
+--output writes the JSON report (use it to store a baseline), --baseline compares against a stored report and
+exits with status 1 when a case got slower than the tolerance allows.
+'''
+import argparse
+import gzip
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GETTER_CASES = ('getEmails', 'getPhoneNumbers', 'getLinks', 'getTitle', 'extract')
+CASES = GETTER_CASES + ('crawl',)
+# The getters Executive.crawl runs by default
+CRAWL_GETTERS = ('getEmails', 'getPhoneNumbers', 'getLinks')
+SEED = 1234
+
+WORDS = ('data', 'service', 'report', 'market', 'customer', 'support', 'product', 'quality', 'delivery', 'team',
+         'office', 'contact', 'update', 'project', 'research', 'network', 'policy', 'account', 'energy', 'local')
+NAMES = ('anna', 'ben', 'carla', 'dmitri', 'emma', 'farid', 'greta', 'hiro', 'ines', 'jonas')
+PHONES = ('555-123-4567', '(555) 987-6543', '555.222.3344', '+1 555 010 9999', '555 444 1212')
+
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def articlePage(rng, index, count):
+    paragraphs = ''.join('<p>{0} {1}</p>\n'.format(sentence(rng), sentence(rng, 20)) for _ in range(rng.randint(15, 40)))
+    links = ''.join('<li><a href="/page{0}.html">{1}</a></li>'.format(rng.randrange(count), rng.choice(WORDS))
+                    for _ in range(10))
+    return ('<!DOCTYPE html><html><head><meta charset="utf-8"><title>Article {0}</title>'
+            '<link rel="stylesheet" href="/style.css"><script>var page = {0};</script></head>'
+            '<body><header><nav><ul>{1}</ul></nav></header><main><article><h1>Article {0}</h1>{2}'
+            '<p>Written by {3}@example.com</p></article></main><footer>&copy; Example</footer></body></html>'
+            ).format(index, links, paragraphs, rng.choice(NAMES))
+
+
+def contactPage(rng, index, count):
+    people = ''.join('<tr><td>{0}</td><td><a href="mailto:{0}.{1}@example.org">{0}.{1}@example.org</a></td>'
+                     '<td>{2}</td></tr>\n'.format(rng.choice(NAMES), rng.randrange(100), rng.choice(PHONES))
+                     for _ in range(rng.randint(20, 60)))
+    return ('<html><head><title>Contacts {0}</title></head><body><h1>Team</h1><table>{1}</table>'
+            '<p>Call {2} or write to office@example.net.</p><a href="/page{3}.html">Next</a></body></html>'
+            ).format(index, people, rng.choice(PHONES), (index + 1) % count)
+
+
+def directoryPage(rng, index, count):
+    links = ''.join('<li><a href="{0}">{1} {2}</a></li>\n'.format(
+        rng.choice(('/page{0}.html'.format(rng.randrange(count)), 'https://example.com/{0}'.format(rng.choice(WORDS)),
+                    '#top', 'mailto:info@example.com', '/files/{0}.pdf'.format(rng.choice(WORDS)))),
+        rng.choice(WORDS), rng.randrange(1000)) for _ in range(rng.randint(200, 500)))
+    return '<html><head><title>Directory {0}</title></head><body><ul>{1}</ul></body></html>'.format(index, links)
+
+
+def legacyPage(rng, index, count):
+    # Unclosed tags, upper case markup and no charset declaration, served as windows-1252
+    rows = ''.join('<TR><TD>{0}<TD>{1} café naïve<TD>{2}\n'.format(rng.choice(NAMES), sentence(rng, 6),
+                                                                         rng.choice(PHONES)) for _ in range(80))
+    return ('<HTML><HEAD><TITLE>Legacy {0}</TITLE></HEAD><BODY BGCOLOR=white><TABLE BORDER=1>{1}</TABLE>'
+            '<P>Mail webmaster@example.com<P><A HREF="page0.html">Home</A></BODY></HTML>').format(index, rows)
+
+
+TEMPLATES = (articlePage, contactPage, directoryPage, legacyPage)
+
+
+def buildCorpus(count):
+    '''
+    Returns {path: (content type, body)} for count pages. The same count always gives the same pages.
+    '''
+    rng = random.Random(SEED)
+    corpus = {}
+    for index in range(count):
+        template = TEMPLATES[index % len(TEMPLATES)]
+        html = template(rng, index, count)
+        if template is legacyPage:
+            corpus['/page{0}.html'.format(index)] = ('text/html', html.encode('cp1252'))
+        else:
+            corpus['/page{0}.html'.format(index)] = ('text/html; charset=utf-8', html.encode('utf-8'))
+    return corpus
+
+
+def loadCorpus(directory):
+    '''
+    Uses the .html files of a directory instead of the generated pages
+    '''
+    corpus = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(directory, name), 'rb') as f:
+                corpus['/' + name] = ('text/html', f.read())
+    return corpus
+
+
+def startServer(corpus):
+    '''
+    Serves the corpus on a free local port from a background thread, gzip compressed when the client accepts
+    it. Anything else, robots.txt included, is a 404.
+    '''
+    compressed = {path: gzip.compress(body, 6) for path, (kind, body) in corpus.items()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out in separate writes, with Nagle on every response waits for a delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            entry = corpus.get(self.path)
+            if entry is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = entry[1]
+            self.send_response(200)
+            self.send_header('Content-Type', entry[0])
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = compressed[self.path]
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def peakRss():
+    '''
+    Peak resident set size of this process in MB, None where the resource module is missing (Windows)
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 2)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def pageStarted(url):
+    return time.perf_counter()
+
+
+def pageFinished(url):
+    return time.perf_counter()
+
+
+def runCase(case, urls, rounds, workers):
+    '''
+    Runs one case in this process and returns its measurements. Latencies are per page in milliseconds: the
+    getter call, or for the crawl case the time a worker spent on the page, from its first getter to its last.
+    '''
+    import contextlib
+    import io
+    from executive import Executive
+    latencies = []
+    # The getters print fetch errors, keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        # One untimed page so the lazy bs4 and urllib3 imports are not counted as latency
+        Executive().extract(urls[0])
+        start = time.perf_counter()
+        for _ in range(rounds):
+            executive = Executive()
+            if case == 'crawl':
+                # crawl's own getters between two clock readings taken on the worker thread, the gap between
+                # finished pages would measure throughput instead
+                extractors = [pageStarted] + list(CRAWL_GETTERS) + [pageFinished]
+                for url, results in executive.crawl(urls, extractors, max_workers=workers, per_host=workers):
+                    latencies.append((results['pageFinished'] - results['pageStarted']) * 1000)
+            else:
+                getter = getattr(executive, case)
+                for url in urls:
+                    started = time.perf_counter()
+                    getter(url)
+                    latencies.append((time.perf_counter() - started) * 1000)
+    seconds = time.perf_counter() - start
+    return {'pages': len(latencies),
+            'seconds': round(seconds, 3),
+            'pages_per_sec': round(len(latencies) / seconds, 2),
+            'p50_ms': round(percentile(latencies, 0.5), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'peak_rss_mb': peakRss()}
+
+
+def runSuite(cases=CASES, pages=200, rounds=3, workers=8, corpus_dir=None):
+    '''
+    Serves the corpus and runs every case in its own interpreter, returns the JSON report as a dict
+    '''
+    corpus = loadCorpus(corpus_dir) if corpus_dir else buildCorpus(pages)
+    server = startServer(corpus)
+    base = 'http://127.0.0.1:{0}'.format(server.server_address[1])
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    try:
+        for case in cases:
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), '--run-case', case, '--base', base,
+                                      '--rounds', str(rounds), '--workers', str(workers)],
+                                     input='\n'.join(corpus), cwd=here, capture_output=True, text=True, check=True)
+            results[case] = json.loads(process.stdout.splitlines()[-1])
+    finally:
+        server.shutdown()
+    return {'python': sys.version.split()[0], 'platform': sys.platform, 'pages': len(corpus),
+            'corpus_bytes': sum(len(body) for kind, body in corpus.values()), 'rounds': rounds, 'cases': results}
+
+
+def compare(report, baseline, tolerance=0.15):
+    '''
+    Returns a list of regressions: cases whose pages/sec fell, or whose p99 latency or peak RSS grew, by more
+    than tolerance relative to the baseline
+    '''
+    regressions = []
+    for case, result in report['cases'].items():
+        before = baseline.get('cases', {}).get(case)
+        if before is None:
+            continue
+        for metric, higher_is_better in (('pages_per_sec', True), ('p99_ms', False), ('peak_rss_mb', False)):
+            if result.get(metric) is None or before.get(metric) is None:
+                continue
+            limit = before[metric] * (1 - tolerance if higher_is_better else 1 + tolerance)
+            if (result[metric] < limit) if higher_is_better else (result[metric] > limit):
+                regressions.append({'case': case, 'metric': metric, 'baseline': before[metric],
+                                    'current': result[metric], 'limit': round(limit, 3)})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline throughput benchmark for the Executive getters and crawl mode')
+    parser.add_argument('--pages', type=int, default=200, help='number of generated pages')
+    parser.add_argument('--corpus', metavar='DIR', help='serve the .html files of this directory instead')
+    parser.add_argument('--rounds', type=int, default=3, help='passes over the corpus per case')
+    parser.add_argument('--workers', type=int, default=8, help='worker threads for the crawl case')
+    parser.add_argument('--cases', default=','.join(CASES), help='comma separated list of: ' + ', '.join(CASES))
+    parser.add_argument('--output', metavar='FILE', help='write the JSON report here')
+    parser.add_argument('--baseline', metavar='FILE', help='compare against this stored report')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative slowdown (default 0.15)')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    parser.add_argument('--base', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        urls = [args.base + path for path in sys.stdin.read().split()]
+        print(json.dumps(runCase(args.run_case, urls, args.rounds, args.workers)))
+        sys.exit(0)
+
+    cases = [x.strip() for x in args.cases.split(',') if x.strip()]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error('unknown cases: ' + ', '.join(sorted(unknown)))
+    report = runSuite(cases, args.pages, args.rounds, args.workers, args.corpus)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+    sys.exit(1 if report.get('regressions') else 0)
@@ -0,0 +1,328 @@
+'''
+Caches used by the Executive so that a page is only downloaded and parsed once.
+'''
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+MAX_AGE = re.compile(r'max-age\s*=\s*"?(\d+)')
+
+# A parsed BeautifulSoup tree takes roughly this many times the size of the raw html in memory
+TREE_OVERHEAD = 10
+
+
+def normalizeUrl(url):
+    '''
+    Returns a canonical form of a url so that equivalent spellings share one cache entry: the scheme and host
+    are lowercased, default ports and fragments are dropped and an empty path becomes '/'.
+    '''
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        host = host + ':' + str(parts.port)
+    if parts.username:
+        credentials = parts.username + (':' + parts.password if parts.password else '')
+        host = credentials + '@' + host
+    path = parts.path if parts.path else '/'
+    return urlunsplit((scheme, host, path, parts.query, ''))
+
+
+class DocumentCache:
+    '''
+    LRU cache of parsed documents keyed by normalized url. Entries expire after ttl seconds and the least
+    recently used entries are evicted once there are more than max_entries of them or their estimated
+    memory use goes past max_bytes.
+    '''
+    def __init__(self, max_entries=128, ttl=300, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, variant=None):
+        key = self.key(url, variant)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            document, size, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                self.remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return document
+
+    def put(self, url, document, size, variant=None):
+        '''
+        Stores a document; size is an estimate of how much memory it takes, see TREE_OVERHEAD. Partial trees
+        or the raw html of a page are stored under a variant so they never stand in for the full document.
+        '''
+        key = self.key(url, variant)
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (document, size, time.monotonic())
+            self.total_bytes += size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self.remove(oldest)
+
+    def key(self, url, variant=None):
+        key = normalizeUrl(url)
+        return key if variant is None else key + '#' + variant
+
+    def remove(self, key):
+        document, size, stored_at = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def invalidate(self, url=None):
+        '''
+        Drops every entry for a url, or every entry when no url is given
+        '''
+        with self.lock:
+            if url is None:
+                self.entries.clear()
+                self.total_bytes = 0
+                return
+            key = normalizeUrl(url)
+            for x in [x for x in self.entries if x == key or x.startswith(key + '#')]:
+                self.remove(x)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.total_bytes, 'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, url):
+        return normalizeUrl(url) in self.entries
+
+
+class HttpCache:
+    '''
+    Persistent cache of response bodies and their validators (ETag / Last-Modified) kept in a directory.
+    Entries are reused without a request while Cache-Control max-age says they are fresh, and revalidated
+    with a conditional GET after that. The least recently used entries are deleted once the bodies take up
+    more than max_bytes.
+    '''
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index = {}
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                meta = self.readMeta(name[:-5])
+                if meta is not None:
+                    self.index[name[:-5]] = (meta['size'], meta['used_at'])
+        self.total_bytes = sum(size for size, used_at in self.index.values())
+
+    def key(self, url):
+        return hashlib.sha1(normalizeUrl(url).encode('utf-8')).hexdigest()
+
+    def path(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def readMeta(self, key):
+        try:
+            with open(self.path(key, '.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def lookup(self, url):
+        '''
+        Returns (meta, body) for a cached url or None. meta holds the validators and whether it is still fresh.
+        '''
+        key = self.key(url)
+        with self.lock:
+            if key not in self.index:
+                return None
+            meta = self.readMeta(key)
+            try:
+                with open(self.path(key, '.body'), 'rb') as f:
+                    body = f.read()
+            except OSError:
+                meta = None
+            if meta is None:
+                self.delete(key)
+                return None
+            self.index[key] = (meta['size'], time.time())
+        meta['fresh'] = meta['max_age'] is not None and time.time() - meta['stored_at'] < meta['max_age']
+        return meta, body
+
+    def conditionalHeaders(self, meta):
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def store(self, url, headers, body):
+        '''
+        Saves a 200 response unless Cache-Control forbids it
+        '''
+        cache_control = headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control or len(body) > self.max_bytes:
+            return
+        key = self.key(url)
+        meta = {'url': url, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified'),
+                'max_age': self.maxAge(cache_control), 'stored_at': time.time(), 'used_at': time.time(),
+                'size': len(body)}
+        with self.lock:
+            if key in self.index:
+                self.delete(key)
+            with open(self.path(key, '.body'), 'wb') as f:
+                f.write(body)
+            self.writeMeta(key, meta)
+            self.index[key] = (len(body), meta['used_at'])
+            self.total_bytes += len(body)
+            self.evict()
+
+    def refresh(self, url, headers, meta):
+        '''
+        Restarts the freshness clock of an entry after the server answered 304 Not Modified
+        '''
+        cache_control = headers.get('Cache-Control', '').lower()
+        meta = dict(meta)
+        meta.pop('fresh', None)
+        meta['stored_at'] = meta['used_at'] = time.time()
+        if 'max-age' in cache_control or 'no-cache' in cache_control:
+            meta['max_age'] = self.maxAge(cache_control)
+        meta['etag'] = headers.get('ETag') or meta['etag']
+        meta['last_modified'] = headers.get('Last-Modified') or meta['last_modified']
+        with self.lock:
+            key = self.key(url)
+            if key in self.index:
+                self.writeMeta(key, meta)
+
+    def maxAge(self, cache_control):
+        if 'no-cache' in cache_control:
+            return 0
+        match = MAX_AGE.search(cache_control)
+        return int(match.group(1)) if match else None
+
+    def writeMeta(self, key, meta):
+        with open(self.path(key, '.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    def evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key in sorted(self.index, key=lambda x: self.index[x][1]):
+            self.delete(key)
+            if self.total_bytes <= self.max_bytes:
+                break
+
+    def delete(self, key):
+        size, used_at = self.index.pop(key, (0, 0))
+        self.total_bytes -= size
+        for extension in ('.body', '.json'):
+            try:
+                os.remove(self.path(key, extension))
+            except OSError:
+                pass
+
+
+def contentHash(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class ResultCache:
+    '''
+    On-disk SQLite index of extraction results keyed by url and the set of extractors that produced them,
+    stored with a hash of the body they came from. When a page is fetched again and its body hashes the same,
+    the stored results are returned without parsing. Once there are more than max_entries rows the least
+    recently used ones are deleted. Hits only note when a row was used; those times are written in one
+    transaction once flush_every rows wait or flush_seconds have passed, before an insert and on close().
+    '''
+    def __init__(self, path, max_entries=1000000, flush_every=1000, flush_seconds=5):
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        # {(url, extractors): used_at} of hits not written yet
+        self.used = {}
+        self.flushed_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS results (url TEXT, extractors TEXT, hash TEXT, data TEXT, '
+                        'used_at REAL, PRIMARY KEY (url, extractors))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS results_used_at ON results (used_at)')
+        self.count = self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url, extractors, digest):
+        '''
+        Returns the stored results if the body hash still matches, otherwise None
+        '''
+        key = normalizeUrl(url)
+        with self.lock:
+            row = self.db.execute('SELECT hash, data FROM results WHERE url = ? AND extractors = ?',
+                                  (key, extractors)).fetchone()
+            if row is None or row[0] != digest:
+                self.misses += 1
+                return None
+            self.used[(key, extractors)] = time.time()
+            if len(self.used) >= self.flush_every or time.monotonic() - self.flushed_at > self.flush_seconds:
+                with self.db:
+                    self.flushUsed()
+            self.hits += 1
+            return json.loads(row[1])
+
+    def flushUsed(self):
+        '''
+        Writes the pending used_at times, the caller holds the lock and a transaction
+        '''
+        if self.used:
+            self.db.executemany('UPDATE results SET used_at = ? WHERE url = ? AND extractors = ?',
+                                [(used_at, url, extractors) for (url, extractors), used_at in self.used.items()])
+            self.used = {}
+        self.flushed_at = time.monotonic()
+
+    def put(self, url, extractors, digest, results):
+        key = normalizeUrl(url)
+        with self.lock, self.db:
+            # Eviction goes by used_at, so it has to see every hit
+            self.flushUsed()
+            existed = self.db.execute('SELECT 1 FROM results WHERE url = ? AND extractors = ?',
+                                      (key, extractors)).fetchone() is not None
+            self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                            (key, extractors, digest, json.dumps(results), time.time()))
+            if not existed:
+                self.count += 1
+            if self.count > self.max_entries:
+                # Trim a little below the limit so eviction does not run on every insert
+                excess = self.count - int(self.max_entries * 0.9)
+                self.db.execute('DELETE FROM results WHERE rowid IN '
+                                '(SELECT rowid FROM results ORDER BY used_at LIMIT ?)', (excess,))
+                self.count -= excess
+
+    def stats(self):
+        return {'entries': self.count, 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        with self.lock:
+            with self.db:
+                self.flushUsed()
+            self.db.close()
@@ -0,0 +1,221 @@
+'''
+Breadth-first site crawler that follows the <a> and <area> links of the pages the Executive fetches
+'''
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from collections import deque
+from urllib.parse import urljoin, urlsplit
+from cache import normalizeUrl
+
+SKIPPED_EXTENSIONS = ('.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.ico', '.pdf', '.zip', '.mp4', '.woff', '.woff2')
+
+
+def canonicalizeUrl(href, base):
+    '''
+    Resolves an href against the page's base url and returns it in canonical form, or None for links that
+    cannot be crawled (mailto:, javascript:, assets, ...)
+    '''
+    href = href.strip()
+    if not href or href.startswith('#'):
+        return None
+    url = urljoin(base, href)
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return None
+    if parts.path.lower().endswith(SKIPPED_EXTENSIONS):
+        return None
+    try:
+        return normalizeUrl(url)
+    except ValueError:
+        return None
+
+
+class VisitedSet:
+    '''
+    Set of urls already seen. Only an 8 byte digest of each url is kept, which takes far less memory than
+    the url strings once a crawl reaches millions of pages.
+    '''
+    def __init__(self):
+        self.digests = set()
+
+    def add(self, url):
+        '''
+        Marks a url as seen and returns True if it had not been seen before
+        '''
+        digest = int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'big')
+        if digest in self.digests:
+            return False
+        self.digests.add(digest)
+        return True
+
+    def __len__(self):
+        return len(self.digests)
+
+
+class BloomVisitedSet:
+    '''
+    Visited set for very large crawls. A Bloom filter held in memory answers most lookups, and only urls the
+    filter thinks it has seen are confirmed against an exact SQLite table on disk, so false positives never
+    drop a url. The filter is sized for capacity urls at the given false positive rate (about 1.2 bytes per
+    url at 1%). checkpoint() saves both to disk, and opening the same path again resumes from there.
+    '''
+    def __init__(self, path, capacity=50000000, error_rate=0.01, batch_size=10000):
+        self.path = path
+        self.bits_count = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.bits_count / capacity * math.log(2)))
+        self.batch_size = batch_size
+        self.pending = set()
+        self.count = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY) WITHOUT ROWID')
+        self.bits = self.loadBits()
+
+    def positions(self, url):
+        digest = hashlib.blake2b(url.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.bits_count for i in range(self.hash_count)]
+
+    def add(self, url):
+        '''
+        Marks a url as seen and returns True if it had not been seen before
+        '''
+        positions = self.positions(url)
+        with self.lock:
+            if all(self.bits[x >> 3] & (1 << (x & 7)) for x in positions) and self.confirm(url):
+                return False
+            for x in positions:
+                self.bits[x >> 3] |= 1 << (x & 7)
+            self.pending.add(url)
+            self.count += 1
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+            return True
+
+    def __contains__(self, url):
+        positions = self.positions(url)
+        with self.lock:
+            return all(self.bits[x >> 3] & (1 << (x & 7)) for x in positions) and self.confirm(url)
+
+    def confirm(self, url):
+        if url in self.pending:
+            return True
+        return self.db.execute('SELECT 1 FROM visited WHERE url = ?', (url,)).fetchone() is not None
+
+    def flush(self):
+        self.db.executemany('INSERT OR IGNORE INTO visited VALUES (?)', ((x,) for x in self.pending))
+        self.db.commit()
+        self.pending.clear()
+
+    def checkpoint(self):
+        '''
+        Writes pending urls to SQLite and the filter bits next to it so a crawl can be resumed
+        '''
+        with self.lock:
+            self.flush()
+            with open(self.path + '.bloom.tmp', 'wb') as f:
+                f.write(self.bits_count.to_bytes(8, 'little') + self.hash_count.to_bytes(8, 'little')
+                        + self.count.to_bytes(8, 'little'))
+                f.write(self.bits)
+            os.replace(self.path + '.bloom.tmp', self.path + '.bloom')
+
+    def loadBits(self):
+        # add() flushes urls to the table between checkpoints, so after an unclean stop the table can hold urls
+        # the saved filter has never seen. Those would be false negatives, so such a filter is rebuilt.
+        rows = self.db.execute('SELECT COUNT(*) FROM visited').fetchone()[0]
+        try:
+            with open(self.path + '.bloom', 'rb') as f:
+                header = f.read(24)
+                if (int.from_bytes(header[:8], 'little') == self.bits_count
+                        and int.from_bytes(header[8:16], 'little') == self.hash_count
+                        and int.from_bytes(header[16:], 'little') == rows):
+                    self.count = rows
+                    return bytearray(f.read())
+        except OSError:
+            pass
+        # No usable checkpoint of the filter, rebuild it from the exact table
+        bits = bytearray((self.bits_count + 7) // 8)
+        self.count = 0
+        for (url,) in self.db.execute('SELECT url FROM visited'):
+            for x in self.positions(url):
+                bits[x >> 3] |= 1 << (x & 7)
+            self.count += 1
+        return bits
+
+    def close(self):
+        self.checkpoint()
+        self.db.close()
+
+    def __len__(self):
+        return self.count
+
+
+class Crawler:
+    '''
+    Crawls outward from seed urls one depth level at a time. Every level is handed to Executive.crawl, so the
+    worker pool and per-host limits apply, and links are canonicalized and deduplicated before they are queued.
+    By default only the hosts of the seed urls are followed.
+    '''
+    def __init__(self, executive, max_depth=2, max_pages=None, allowed_domains=None, visited=None):
+        self.executive = executive
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.allowed_domains = None if allowed_domains is None else set(x.lower() for x in allowed_domains)
+        self.visited = VisitedSet() if visited is None else visited
+        self.frontier = deque()
+
+    def run(self, seeds, extractors=('getEmails', 'getPhoneNumbers'), **crawl_options):
+        '''
+        Yields (url, depth, results) for every page crawled, where results holds the output of the
+        extractors just like Executive.crawl
+        '''
+        if self.allowed_domains is None:
+            self.allowed_domains = set(urlsplit(x).hostname.lower() for x in seeds)
+        for seed in seeds:
+            self.enqueue(seed, 0)
+        pages = 0
+        while self.frontier:
+            depth = self.frontier[0][1]
+            level = []
+            while self.frontier and self.frontier[0][1] == depth:
+                if self.max_pages is not None and pages + len(level) >= self.max_pages:
+                    self.frontier.clear()
+                    break
+                level.append(self.frontier.popleft()[0])
+            for url, results in self.executive.crawl(level, list(extractors) + [self.pageLinks], **crawl_options):
+                pages += 1
+                # Pages robots.txt disallows come back as {'skipped': ...} without links, they are not followed
+                links = results.pop('pageLinks', None)
+                if depth < self.max_depth and 'skipped' not in results:
+                    for link in links or []:
+                        self.enqueue(link, depth + 1)
+                yield url, depth, results
+
+    def enqueue(self, href, depth, base=None):
+        url = canonicalizeUrl(href, base or href)
+        if url is None or not self.allowedDomain(url):
+            return
+        if self.visited.add(url):
+            self.frontier.append((url, depth))
+
+    def allowedDomain(self, url):
+        host = urlsplit(url).hostname
+        return any(host == x or host.endswith('.' + x) for x in self.allowed_domains)
+
+    def pageLinks(self, url):
+        '''
+        Returns the page's links resolved against its <base href> (or its own url) and canonicalized. Only <a>
+        and <area> are followed, the href of <base>, <link> feeds and stylesheets are not pages.
+        '''
+        # The same partial tree getLinks parses, so a crawl running both parses the page once
+        html_code = self.executive.getSiteHtml(url, [self.executive.strainers['getLinks']])
+        if html_code is None:
+            return []
+        base_tag = html_code.find('base', href=True)
+        base = urljoin(url, base_tag['href']) if base_tag is not None else url
+        links = [canonicalizeUrl(x['href'], base) for x in html_code.find_all(('a', 'area'), href=True)]
+        return [x for x in links if x is not None]
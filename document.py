@@ -0,0 +1,77 @@
+'''
+Handle on a page that has already been fetched and parsed, returned by Executive.getDocument. Any number of
+queries can be run against it without going back to the network or the document cache, and the traversal
+queries return generators, so walking a few siblings does not build a list of all of them.
+'''
+
+
+class Document:
+    '''
+    Wraps the BeautifulSoup tree of one page. Every query takes the starting element either as a tag name and
+    attributes, like find(), or as an element from an earlier query, so navigation can be chained:
+
+        doc = executive.getDocument(url)
+        table = doc.find('table', {'id': 'prices'})
+        for row in doc.nextSiblings(table):
+            ...
+    '''
+    def __init__(self, url, soup):
+        self.url = url
+        self.soup = soup
+        self.anchors = {}
+
+    def find(self, tag=None, attribute={}):
+        '''
+        Returns the first tag matching tag and attribute, or the element itself when tag is already one.
+        Lookups by name and attributes are remembered, so asking for the same tag again is free.
+        '''
+        from bs4.element import PageElement
+        if isinstance(tag, PageElement):
+            return tag
+        key = (tag, repr(attribute))
+        if key not in self.anchors:
+            self.anchors[key] = self.soup.find(tag, attribute)
+        return self.anchors[key]
+
+    def tags(self, tag=None, attribute={}):
+        '''
+        Yields the tags matching tag and attribute in document order, like a lazy find_all()
+        '''
+        from bs4 import SoupStrainer
+        from bs4.element import Tag
+        strainer = SoupStrainer(tag, attribute)
+        return (x for x in self.soup.descendants if isinstance(x, Tag) and strainer.search_tag(x))
+
+    def parents(self, tag=None, attribute={}):
+        return self.walk(tag, attribute, 'parents')
+
+    def children(self, tag=None, attribute={}):
+        return self.walk(tag, attribute, 'children')
+
+    def descendants(self, tag=None, attribute={}):
+        return self.walk(tag, attribute, 'descendants')
+
+    def nextSiblings(self, tag=None, attribute={}):
+        return self.walk(tag, attribute, 'next_siblings')
+
+    def previousSiblings(self, tag=None, attribute={}):
+        return self.walk(tag, attribute, 'previous_siblings')
+
+    def nextSibling(self, tag=None, attribute={}):
+        return next(self.nextSiblings(tag, attribute), None)
+
+    def previousSibling(self, tag=None, attribute={}):
+        return next(self.previousSiblings(tag, attribute), None)
+
+    def walk(self, tag, attribute, direction):
+        '''
+        Returns bs4's generator for direction ('parents', 'next_siblings', ...) starting at the matching tag,
+        an empty one when nothing matches
+        '''
+        start = self.find(tag, attribute)
+        if start is None:
+            return iter(())
+        return getattr(start, direction)
+
+    def __repr__(self):
+        return '<Document {0}>'.format(self.url)
@@ -1,23 +1,106 @@
 '''
 Necessary libraries for this program to function. BeautifulSoup must be installed locally; to do so, type pip install bs4 into your
-terminal.
+terminal. bs4 and urllib3 are only imported once a feature needs them so that creating an Executive stays fast.
 '''
-from urllib.request import urlopen
 from urllib.error import HTTPError, URLError
-from bs4 import BeautifulSoup
+import importlib.util
 import re
-import sys
-import subprocess
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from cache import DocumentCache, HttpCache, ResultCache, TREE_OVERHEAD, contentHash
+from fetch import Fetcher, CachingFetcher, ResponseTooLarge
+from extract import (ExtractionEngine, ContactScanner, LinkExtractor, TitleExtractor, JsonLdExtractor, OpenGraphExtractor,
+                     MicrodataExtractor, ContactStream, sniffEncoding, scanJsonLd)
+from functools import partial
+from scheduler import HostScheduler, RobotsCache, AdaptiveRateLimiter
+from parsers import resolveParser, combineStrainers, strainerKey
+from metrics import Metrics
+from document import Document
+from templates import compileTemplate
+
+REQUIRED_MODULES = {'bs4': 'beautifulsoup4', 'urllib3': 'urllib3'}
+dependencies_checked = False
+
+def checkDependencies():
+    '''
+    Makes sure the required packages are installed without importing them or touching the network. The check
+    only runs once per process.
+    '''
+    global dependencies_checked
+    if not dependencies_checked:
+        missing = [package for module, package in REQUIRED_MODULES.items() if importlib.util.find_spec(module) is None]
+        if missing:
+            raise ImportError('Missing packages, install them with: pip install ' + ' '.join(missing))
+        dependencies_checked = True
+
+worker_engine = None
+worker_options = None
+
+def startWorker(factories, parser, partial_parsing):
+    '''
+    Sets up an extraction engine in a worker process of Executive.crawlProcesses
+    '''
+    global worker_engine, worker_options
+    worker_engine = ExtractionEngine(factories)
+    worker_options = (parser, partial_parsing)
+
+def parseAndExtract(html, names):
+    '''
+    Parses raw html in a worker process and returns only the extraction record, never the tree itself
+    '''
+    from bs4 import BeautifulSoup
+    parser, partial_parsing = worker_options
+    strainer = combineStrainers(worker_engine.strainers(names)) if partial_parsing else None
+    return worker_engine.run(BeautifulSoup(html, resolveParser(parser), parse_only=strainer), names)
 
 class Executive:
     '''
     Getter methods used to extract specific data from an html source
     '''
-    def __init__(self):
-        subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'requests'])
+    def __init__(self, cache_size=128, cache_ttl=300, cache_bytes=256 * 1024 * 1024, fetcher=None,
+                 http_cache_dir=None, http_cache_bytes=1024 * 1024 * 1024, parser='html.parser', partial_parsing=True,
+                 adaptive_rate=False, result_cache_path=None, result_cache_entries=1000000,
+                 max_bytes=20 * 1024 * 1024, max_decompressed_bytes=50 * 1024 * 1024, oversize='truncate',
+                 metrics=False, trace=False):
+        checkDependencies()
+        # Per-stage timings and counters, see metricsSnapshot(). trace adds a per-page timing record to crawl results
+        self.metrics = Metrics() if metrics or trace else None
+        self.trace = trace
+        # Any builder name BeautifulSoup knows ('html.parser', 'lxml', 'html5lib') or 'auto' for the fastest one installed
+        self.parser = parser
+        # Getters that only look at a few tags build just those tags instead of the whole tree
+        self.partial_parsing = partial_parsing
+        # Slows down on 429/503 and speeds back up while a host answers normally, see scheduler.AdaptiveRateLimiter
+        self.limiter = AdaptiveRateLimiter() if adaptive_rate else None
+        if fetcher is None:
+            # Pages over the size limits are cut short (or dropped with oversize='abort') instead of filling memory
+            fetcher = Fetcher(limiter=self.limiter, max_bytes=max_bytes, max_decompressed_bytes=max_decompressed_bytes,
+                              oversize=oversize, metrics=self.metrics)
+        self.fetcher = fetcher
+        if http_cache_dir is not None:
+            # Scheduled re-scrapes only download pages that changed since the last run
+            self.fetcher = CachingFetcher(self.fetcher, HttpCache(http_cache_dir, http_cache_bytes))
+        # Pages whose body has not changed since the last run get their extraction results back without a parse
+        self.result_cache = None if result_cache_path is None else ResultCache(result_cache_path, result_cache_entries)
+        # Every getter goes through getSiteHtml, so they all share one download and one parse per page
+        self.document_cache = DocumentCache(cache_size, cache_ttl, cache_bytes)
         self.email_format = re.compile('[A-Za-z0-9\._+]+@[A-Za-z]+\.(com|org|edu|net)')
         self.number_format = re.compile('[0-9][0-9][0-9]-[0-9][0-9][0-9]-[0-9][0-9][0-9][0-9]')
+        # Emails and phone numbers come from one regex pass over the page text, see extract.ContactScanner
+        self.engine = ExtractionEngine({'contacts': ContactScanner,
+                                        'emails': partial(ContactScanner, only='emails'),
+                                        'phones': partial(ContactScanner, only='phones'),
+                                        'links': LinkExtractor,
+                                        'title': TitleExtractor,
+                                        'jsonld': JsonLdExtractor,
+                                        'opengraph': OpenGraphExtractor,
+                                        'microdata': MicrodataExtractor})
+        # The (name, attrs) of the tags each getter needs, None means the getter needs the whole document
+        self.strainers = {'getLinks': (None, {'href': True}), 'getTitle': ('title', {}),
+                          'getOpenGraph': OpenGraphExtractor.strainer, 'getMicrodata': MicrodataExtractor.strainer}
+        self.robots = RobotsCache(self.fetcher)
+        # When each host may next be requested by a polite crawl, kept across crawl() calls such as Crawler's levels
+        self.next_request = {}
 
 
     def start(self):
@@ -36,7 +119,7 @@ class Executive:
             if choice == '1':
                 print(self.getSiteHtml(inp))
             elif choice == '2':
-                print(self.specificTags())
+                print(self.specificTags(inp))
             elif choice == '3':
                 print(*self.getLinks(inp), sep='\n')
             elif choice == '4':
@@ -49,12 +132,36 @@ class Executive:
 
     def specificTags(self, url):
         tag_type = input('Enter a tag type: ')
-        attribute = input('Enter the tag attribute: ')
+        attribute = input('Enter the tag attribute (e.g. class=title, href, or nothing): ').strip()
+        name, equals, value = attribute.partition('=')
+        attrs = {} if not name else {name.strip(): value.strip() if equals else True}
+        return self.applyTemplate(url, {'name': tag_type, 'fields': {tag_type: {'tag': tag_type, 'attrs': attrs,
+                                                                                'many': True, 'post': ['collapse']}}})
+
+    def applyTemplate(self, url, template):
+        '''
+        Extracts the fields of a declarative template (see templates.py) from the page in one traversal and
+        returns {field: value}. The template is compiled once however many pages it is applied to.
+        '''
+        compiled = compileTemplate(template)
+        html_code = self.getSiteHtml(url, compiled.strainers)
+        if html_code is None:
+            return None
+        return ExtractionEngine({compiled.name: compiled.extractor}).run(html_code, [compiled.name], self.metrics)[compiled.name]
+
+    def addTemplate(self, template):
+        '''
+        Registers a template as an extractor under its name so extract(), crawlProcesses() and batch runs can
+        use it next to the built in ones
+        '''
+        compiled = compileTemplate(template)
+        self.engine.register(compiled.name, compiled.extractor)
+        return compiled.name
 
 
     def getTitle(self, url):
         try:
-            html_code = self.getSiteHtml(url)
+            html_code = self.getSiteHtml(url, [self.strainers['getTitle']])
             page_title = html_code.title
         except HTTPError as e:
             print(e)
@@ -66,20 +173,66 @@ class Executive:
             return page_title.get_text()
 
 
-    def getSiteHtml(self, url):
+    def getSiteHtml(self, url, only=None, html=None):
+        '''
+        Returns the parsed page. only is a list of (name, attrs) specs; when given, and partial parsing is on,
+        just the matching tags are built. A cached full tree is always preferred since it answers any query.
+        Pass html to parse a body that was already downloaded, it replaces whatever is cached for the url since
+        the page may have changed since that was parsed.
+        '''
+        strainer = combineStrainers(only) if self.partial_parsing else None
+        variant = None if strainer is None else strainerKey(only)
+        if html is not None:
+            self.document_cache.invalidate(url)
+        bs = self.document_cache.get(url)
+        if bs is None and variant is not None:
+            bs = self.document_cache.get(url, variant)
+        if bs is not None:
+            return bs
+        from bs4 import BeautifulSoup
         try:
-            html = urlopen(url)
-            bs = BeautifulSoup(html, 'html.parser')
+            # The raw html of a partially parsed page is kept so other getters can parse it without fetching again
+            if html is None:
+                html = self.document_cache.get(url, 'raw')
+            if html is None:
+                html = self.fetcher.fetch(url)
+            if self.metrics is None:
+                bs = BeautifulSoup(html, resolveParser(self.parser), parse_only=strainer)
+            else:
+                bs = self.timedParse(html, strainer)
         except HTTPError as e:
             print(e)
+        except ResponseTooLarge as g:
+            print('The page was too large:', g.reason)
         except URLError as f:
             print('The server could not be reached')
         else:
+            if variant is None:
+                self.document_cache.put(url, bs, len(html) * TREE_OVERHEAD)
+            else:
+                self.document_cache.put(url, html, len(html), 'raw')
+                self.document_cache.put(url, bs, len(html), variant)
             return bs
 
+    def timedParse(self, html, strainer):
+        '''
+        Parses like getSiteHtml but times encoding detection and tree building separately
+        '''
+        from bs4 import BeautifulSoup, UnicodeDammit
+        markup = html
+        if isinstance(html, bytes):
+            with self.metrics.timer('encoding'):
+                markup = UnicodeDammit(html, is_html=True).unicode_markup
+            if markup is None:
+                markup = html
+        with self.metrics.timer('tree_build'):
+            bs = BeautifulSoup(markup, resolveParser(self.parser), parse_only=strainer)
+        self.metrics.count('pages_parsed')
+        return bs
+
     def getTags(self, url, tag, attribute):
         try:
-            html_code = self.getSiteHtml(url)
+            html_code = self.getSiteHtml(url, [(tag, attribute)])
             heading_list_alt = html_code.find_all(tag, attribute)
         except HTTPError as e:
             print(e)
@@ -101,30 +254,293 @@ class Executive:
 
     def getEmails(self, url):
         html_code = self.getSiteHtml(url)
-        emails = [x.strip(' \n') for x in html_code.find_all(text=self.email_format)]
+        if html_code is None:
+            return None
+        emails = self.engine.run(html_code, ['emails'], self.metrics)['emails']
         return (["None"] if self.isEmpty(emails) == True else emails)
 
     def getPhoneNumbers(self, url):
         html_code = self.getSiteHtml(url)
-        numbers = [x.strip(' \n') for x  in html_code.find_all(text=self.number_format)]
+        if html_code is None:
+            return None
+        numbers = self.engine.run(html_code, ['phones'], self.metrics)['phones']
         return (["None"] if self.isEmpty(numbers) == True else numbers)
 
-    def getLinks(self, url):
+    def getContactSources(self, url):
+        '''
+        Returns {email or phone number: [where it was found]}, the document strings a match was read from (their
+        parent is the tag) or the tags whose attributes held an address
+        '''
         html_code = self.getSiteHtml(url)
+        if html_code is None:
+            return None
+        engine = ExtractionEngine({'contacts': partial(ContactScanner, sources=True)})
+        return engine.run(html_code, ['contacts'], self.metrics)['contacts']['sources']
+
+    def getLinks(self, url):
+        html_code = self.getSiteHtml(url, [self.strainers['getLinks']])
+        if html_code is None:
+            return None
         links = [x.attrs['href'] for x in html_code.find_all((lambda tag: self.hasHref(tag.attrs)))]
         return (["None"] if self.isEmpty(links) == True else links)
 
-    def getParents(self, tag, attribute,url):
+    def getJsonLd(self, url):
+        '''
+        Returns the objects of the page's JSON-LD blocks. They are cut out of the raw html, no tree is built,
+        unless only a full tree of the page is cached, which is read instead of downloading the page again.
+        '''
+        html = self.document_cache.get(url, 'raw')
+        if html is None:
+            bs = self.document_cache.get(url)
+            if bs is not None:
+                return self.engine.run(bs, ['jsonld'], self.metrics)['jsonld']
+            html = self.fetchPage(url)
+            if html is None:
+                return None
+            self.document_cache.put(url, html, len(html), 'raw')
+        return scanJsonLd(html)
+
+    def getOpenGraph(self, url):
+        html_code = self.getSiteHtml(url, [self.strainers['getOpenGraph']])
+        if html_code is None:
+            return None
+        return self.engine.run(html_code, ['opengraph'], self.metrics)['opengraph']
+
+    def getMicrodata(self, url):
+        html_code = self.getSiteHtml(url, [self.strainers['getMicrodata']])
+        if html_code is None:
+            return None
+        return self.engine.run(html_code, ['microdata'], self.metrics)['microdata']
+
+    def extract(self, url, names=None):
+        '''
+        Runs the named extractors (all registered ones by default) over the page in a single traversal and
+        returns one record mapping each name to its result. With a result cache, a page whose body hashes the
+        same as last time gets its stored record back without being parsed.
+        '''
+        if self.result_cache is None:
+            html_code = self.getSiteHtml(url, self.engine.strainers(names))
+            if html_code is None:
+                return None
+            return self.engine.run(html_code, names, self.metrics)
+        html = self.fetchPage(url)
+        if html is None:
+            return None
+        key = self.engine.key(names)
+        digest = contentHash(html)
+        results = self.result_cache.get(url, key, digest)
+        if results is None:
+            results = self.engine.run(self.getSiteHtml(url, self.engine.strainers(names), html), names, self.metrics)
+            self.result_cache.put(url, key, digest, results)
+        return results
+
+    def streamContacts(self, url, chunk_size=64 * 1024):
+        '''
+        Finds emails and phone numbers by running email_format and number_format over the page as it
+        downloads, without building a BeautifulSoup tree. Returns the matches themselves rather than the
+        strings that contain them.
+        '''
+        try:
+            headers, chunks = self.fetcher.stream(url, chunk_size)
+            scanner = None
+            for chunk in chunks:
+                if scanner is None:
+                    scanner = ContactStream({'emails': self.email_format, 'phones': self.number_format},
+                                            sniffEncoding(headers, chunk))
+                scanner.feed(chunk)
+        except HTTPError as e:
+            print(e)
+        except ResponseTooLarge as g:
+            print('The page was too large:', g.reason)
+        except URLError as f:
+            print('The server could not be reached')
+        else:
+            return {'emails': [], 'phones': []} if scanner is None else scanner.close()
+
+    def getDocument(self, url):
+        '''
+        Fetches and parses the page once and returns a document.Document to run traversal queries on, or None
+        if the page could not be fetched
+        '''
         html_code = self.getSiteHtml(url)
-        return [x for x in html_code.find(tag, attribute).parents]
+        return None if html_code is None else Document(url, html_code)
+
+    '''
+    The traversal helpers below look the page up again on every call, use getDocument for several queries
+    '''
+    def getParents(self, tag, attribute,url):
+        return self.getDocument(url).parents(tag, attribute)
 
     def getNextSiblings(self, tag, attribute, url):
-        html_code = self.getSiteHtml(url)
-        return [x for x in html_code.find(tag, attribute).next_siblings]
+        return self.getDocument(url).nextSiblings(tag, attribute)
 
     def getPreviousSiblings(self, tag, attribute, url):
-        html_code = self.getSiteHtml(url)
-        return [x for x in html_code.find(tag, attribute).previous_siblings]
+        return self.getDocument(url).previousSiblings(tag, attribute)
+
+    def metricsSnapshot(self):
+        '''
+        Returns the stage timings and counters collected so far along with the fetcher and cache statistics
+        '''
+        snapshot = self.metrics.snapshot() if self.metrics is not None else {'stages': {}, 'counters': {}}
+        snapshot['fetcher'] = self.fetcher.stats()
+        snapshot['document_cache'] = self.document_cache.stats()
+        if self.result_cache is not None:
+            snapshot['result_cache'] = self.result_cache.stats()
+        return snapshot
+
+    '''
+    Batch methods
+    '''
+    def crawl(self, urls, extractors=('getEmails', 'getPhoneNumbers', 'getLinks'), max_workers=16, per_host=4,
+              polite=False):
+        '''
+        Fetches and processes many urls at once on a pool of at most max_workers threads, with no more than
+        per_host requests in flight against any one host. Extractors are getter names or callables taking a
+        url. Yields (url, results) pairs as pages finish, where results maps each extractor name to its output.
+        With polite=True robots.txt is obeyed, pages it disallows come back as {'skipped': ...}, and requests
+        to a host are spaced out by its Crawl-delay while the workers carry on with other hosts.
+        '''
+        extractors = [(x, getattr(self, x)) if isinstance(x, str) else (x.__name__, x) for x in extractors]
+        scheduler = HostScheduler(per_host, self.robots if polite else None, self.limiter,
+                                  self.next_request if polite else None)
+        urls = iter(urls)
+        exhausted = False
+        # Urls are only read ahead a few per worker so huge url lists are not loaded all at once, more are
+        # read when every queued host is busy or cooling down
+        buffered = max_workers * 4
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = {}
+            while True:
+                while not exhausted and len(scheduler) < buffered:
+                    url = next(urls, None)
+                    if url is None:
+                        exhausted = True
+                    else:
+                        scheduler.add(url)
+                wait_time = None
+                while len(pending) < max_workers:
+                    url, wait_time = scheduler.take()
+                    if url is None:
+                        break
+                    pending[pool.submit(self.crawlPage, url, extractors, polite)] = url
+                if len(pending) < max_workers and not exhausted and buffered < max_workers * 256:
+                    buffered *= 2
+                    continue
+                if not pending:
+                    if wait_time is None:
+                        break
+                    time.sleep(wait_time)
+                    continue
+                done, not_done = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    scheduler.done(url)
+                    yield url, future.result()
+
+    def crawlProcesses(self, urls, names=None, processes=None, max_workers=16, per_host=4, polite=False):
+        '''
+        Like crawl, but only the downloads happen on threads here. The raw html is handed to a pool of processes
+        that parse it and run the named engine extractors, so parsing is not held back by the GIL and scales
+        with cores. Only the small result records come back. Yields (url, record), record is None if the fetch
+        failed and has a 'truncated' entry, like crawl's results, when the body was cut at a size limit.
+        Extractors registered on the engine have to be picklable to be used here.
+        '''
+        import multiprocessing
+        import os
+        processes = processes or os.cpu_count() or 1
+        names = list(self.engine.factories) if names is None else names
+        factories = {name: self.engine.factories[name] for name in names}
+        # The workers start on the first submit, when the fetch threads are already running. Forking then could
+        # copy a lock some thread holds (urllib3, sqlite, logging) into the child, so start them from a clean
+        # process instead.
+        start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context(start_method),
+                                 initializer=startWorker,
+                                 initargs=(factories, self.parser, self.partial_parsing)) as pool:
+            pending = {}
+            key = self.engine.key(names)
+            digests = {}
+            truncated = {}
+            for url, results in self.crawl(urls, [self.fetchPage], max_workers, per_host, polite):
+                html = results.get('fetchPage')
+                if html is None:
+                    yield url, None
+                    continue
+                if self.result_cache is not None:
+                    digest = contentHash(html)
+                    cached = self.result_cache.get(url, key, digest)
+                    if cached is not None:
+                        yield url, dict(cached, truncated=results['truncated']) if 'truncated' in results else cached
+                        continue
+                future = pool.submit(parseAndExtract, html, names)
+                pending[future] = url
+                if 'truncated' in results:
+                    truncated[future] = results['truncated']
+                if self.result_cache is not None:
+                    digests[future] = digest
+                # Stop pulling pages while the processes are busy so raw html does not pile up in memory
+                while len(pending) >= processes * 2:
+                    for done_url, record in self.finishedRecords(pending, digests, truncated, key):
+                        yield done_url, record
+            while pending:
+                for done_url, record in self.finishedRecords(pending, digests, truncated, key):
+                    yield done_url, record
+
+    def finishedRecords(self, pending, digests, truncated, key):
+        done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            url = pending.pop(future)
+            record = future.result()
+            if future in digests:
+                self.result_cache.put(url, key, digests.pop(future), record)
+            if future in truncated:
+                record = dict(record, truncated=truncated.pop(future))
+            yield url, record
+
+    def fetchPage(self, url):
+        '''
+        Returns the raw html of a page without parsing it
+        '''
+        try:
+            return self.fetcher.fetch(url)
+        except HTTPError as e:
+            print(e)
+        except ResponseTooLarge as g:
+            print('The page was too large:', g.reason)
+        except URLError as f:
+            print('The server could not be reached')
+
+    def crawlSite(self, seeds, extractors=('getEmails', 'getPhoneNumbers'), max_depth=2, max_pages=None,
+                  allowed_domains=None, visited=None, **crawl_options):
+        '''
+        Follows links breadth first from the seed urls, see crawler.Crawler. Yields (url, depth, results).
+        Pass a crawler.BloomVisitedSet as visited for crawls too large to remember every url in memory.
+        '''
+        from crawler import Crawler
+        site_crawler = Crawler(self, max_depth, max_pages, allowed_domains, visited)
+        return site_crawler.run(seeds, extractors, **crawl_options)
+
+    def crawlPage(self, url, extractors, polite):
+        if polite and not self.robots.allowed(url):
+            return {'skipped': 'disallowed by robots.txt'}
+        results = {}
+        if self.trace:
+            self.metrics.startTrace(url)
+        for name, extractor in extractors:
+            start = time.perf_counter()
+            try:
+                results[name] = extractor(url)
+            except Exception as e:
+                results[name] = None
+                results.setdefault('errors', {})[name] = repr(e)
+            if self.metrics is not None:
+                self.metrics.record('getter.' + name, (time.perf_counter() - start) * 1000)
+        if self.trace:
+            results['trace'] = self.metrics.endTrace()
+        fetched = self.fetcher.lastFetch() if hasattr(self.fetcher, 'lastFetch') else None
+        if fetched is not None and fetched['url'] == url and fetched['truncated']:
+            results['truncated'] = fetched['truncated']
+        return results
 
     '''
     Boolean methods
@@ -156,20 +572,25 @@ class Executive:
         return function(param_one, param_two)
 
     def valid_links(self, link):
-        req = requests.get(link)
-        if (req.status_code == '200'):
+        try:
+            status = self.fetcher.request(link).status
+        except URLError as f:
+            print('The server could not be reached')
+            return False
+        if (status == 200):
             print('HTTP request successful')
+        else:
+            print('HTTP request failed with status', status)
+        return status == 200
 
     '''
     Redundant methods
     '''
     def getNextSibling(self, tag, attribute, url):
-        html_code = self.getSiteHtml(url)
-        return html_code.find(tag, attribute).next_sibling
+        return self.getDocument(url).nextSibling(tag, attribute)
 
     def getPreviousSibling(self, tag,attribute,url):
-        html_code = self.getSiteHtml(url)
-        return html_code.find(tag, attribute).previous_sibling
+        return self.getDocument(url).previousSibling(tag, attribute)
 
     '''
     Menu needs to be completed
@@ -0,0 +1,540 @@
+'''
+Single pass extraction engine. The document is walked once and every node is handed to each registered
+extractor, so running several extractors costs one traversal instead of one find_all per extractor.
+ContactStream covers the case where only regex matches are wanted and no tree is needed at all.
+'''
+import bisect
+import codecs
+import hashlib
+import html
+import json
+import re
+import time
+from urllib.parse import unquote
+
+MARKUP = re.compile(r'<!--.*?-->|<[^>]*>', re.S)
+CHARSET = re.compile(rb'charset=["\']?([A-Za-z0-9_:.-]+)', re.I)
+
+# '@' and '.' may also be written as [at] / (at) / {at} and [dot] / (dot), see normalizeEmail()
+AT = r'(?:@|\s*[\[({]\s*(?i:at)\s*[\])}]\s*)'
+DOT = r'(?:\.|\s*[\[({]\s*(?i:dot)\s*[\])}]\s*)'
+EMAIL = r'[A-Za-z0-9._%+-]+' + AT + r'[A-Za-z0-9-]+(?:' + DOT + r'[A-Za-z0-9-]+)*' + DOT + r'[A-Za-z]{2,}'
+OBFUSCATED_AT = re.compile(r'\s*[\[({]\s*at\s*[\])}]\s*', re.I)
+OBFUSCATED_DOT = re.compile(r'\s*[\[({]\s*dot\s*[\])}]\s*', re.I)
+# North American (555) 123-4567 / 555.123.4567, international +44 20 7946 0958 / +49 (30) 123456 and
+# national numbers with a trunk prefix such as 020 7946 0958
+PHONE = (r'(?<![\w+])(?:\+\d{1,3}(?:[ .-]?\(?\d{1,5}\)?){2,5}'
+         r'|\(?\d{3}\)?[ .-]?\d{3}[ .-]\d{4}'
+         r'|0\d{1,4}[ -]\d{3,4}[ -]?\d{3,4})(?![\w-])')
+CONTACT_PATTERNS = {'emails': EMAIL, 'phones': PHONE}
+# Text in these tags is never shown, and where these tags start or end the text is broken so matches cannot run
+# across them, see PageText
+HIDDEN_TAGS = frozenset(('script', 'style', 'template', 'noscript'))
+BLOCK_TAGS = frozenset(('address', 'article', 'aside', 'blockquote', 'body', 'br', 'button', 'caption', 'dd',
+                        'details', 'div', 'dl', 'dt', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2',
+                        'h3', 'h4', 'h5', 'h6', 'head', 'header', 'hr', 'html', 'legend', 'li', 'main', 'nav', 'ol',
+                        'option', 'p', 'pre', 'section', 'select', 'summary', 'table', 'tbody', 'td', 'textarea',
+                        'tfoot', 'th', 'thead', 'title', 'tr', 'ul'))
+# The type of a JSON-LD script, parameters such as '; charset=utf-8' allowed
+JSON_LD_TYPE = re.compile(r'^\s*application/ld\+json\s*(?:;|$)', re.I)
+JSON_LD = re.compile(r'<script\b[^>]*\btype\s*=\s*["\']?application/ld\+json\b[^>]*>(.*?)</script\s*>', re.I | re.S)
+# OpenGraph properties and the namespaces og:type objects use for their own fields
+OPEN_GRAPH_PREFIXES = ('og:', 'article:', 'book:', 'music:', 'product:', 'profile:', 'video:')
+# Where a microdata property takes its value from, by tag name; other tags use their text
+MICRODATA_VALUES = {'meta': 'content', 'audio': 'src', 'embed': 'src', 'iframe': 'src', 'img': 'src', 'source': 'src',
+                    'track': 'src', 'video': 'src', 'a': 'href', 'area': 'href', 'link': 'href', 'object': 'data',
+                    'data': 'value', 'meter': 'value', 'time': 'datetime'}
+# Attributes besides mailto: hrefs and data-* that sites put addresses in
+EMAIL_ATTRIBUTES = frozenset(('content', 'title', 'value', 'alt', 'aria-label'))
+
+
+class Extractor:
+    '''
+    Base class for extractors. A fresh instance is made for every page; tag() is called for every tag and
+    text() for every string in document order, then result() returns what was collected.
+    strainer is the (name, attrs) of the only tags the extractor looks at, a list of those, or None if it needs
+    the whole document. version is part of the result cache key, change it whenever the output changes so
+    records stored by the old code are not served again.
+    '''
+    strainer = None
+    version = '1'
+
+    def tag(self, tag):
+        pass
+
+    def text(self, string):
+        pass
+
+    def result(self):
+        return None
+
+
+class LinkExtractor(Extractor):
+    '''
+    Collects the href of every tag that has one
+    '''
+    strainer = (None, {'href': True})
+
+    def __init__(self):
+        self.found = []
+
+    def tag(self, tag):
+        if 'href' in tag.attrs:
+            self.found.append(tag.attrs['href'])
+
+    def result(self):
+        return self.found
+
+
+class TitleExtractor(Extractor):
+    strainer = ('title', {})
+
+    def __init__(self):
+        self.title = None
+
+    def tag(self, tag):
+        if self.title is None and tag.name == 'title':
+            self.title = tag.get_text()
+
+    def result(self):
+        return self.title
+
+
+class JsonLdExtractor(Extractor):
+    '''
+    Collects the objects of every <script type="application/ld+json"> block, see also scanJsonLd()
+    '''
+    strainer = ('script', {'type': JSON_LD_TYPE})
+    version = '2'
+
+    def __init__(self):
+        self.found = []
+
+    def tag(self, tag):
+        if tag.name == 'script' and JSON_LD_TYPE.search(tag.get('type', '')):
+            self.found.extend(parseJsonLd(tag.string or ''))
+
+    def result(self):
+        return self.found
+
+
+class OpenGraphExtractor(Extractor):
+    '''
+    Collects <meta property="og:..."> into {property: content}. A property that appears several times, such
+    as og:image, maps to a list of its contents.
+    '''
+    strainer = ('meta', {'property': True})
+
+    def __init__(self):
+        self.found = {}
+
+    def tag(self, tag):
+        if tag.name == 'meta':
+            name = tag.get('property')
+            if isinstance(name, str) and name.startswith(OPEN_GRAPH_PREFIXES) and tag.get('content') is not None:
+                addValue(self.found, name, tag['content'])
+
+    def result(self):
+        return self.found
+
+
+class MicrodataExtractor(Extractor):
+    '''
+    Collects the top level microdata items as {'type': itemtype, 'id': itemid, 'properties': {name: value}}.
+    Nested itemscope values become items themselves and repeated properties become lists. The strainer keeps
+    each itemscope tag with everything inside it.
+    '''
+    strainer = (None, {'itemscope': True})
+
+    def __init__(self):
+        self.found = []
+
+    def tag(self, tag):
+        if 'itemscope' in tag.attrs and 'itemprop' not in tag.attrs:
+            self.found.append(microdataItem(tag))
+
+    def result(self):
+        return self.found
+
+
+def microdataItem(scope):
+    item = {'type': scope.get('itemtype'), 'id': scope.get('itemid'), 'properties': {}}
+    # A stack with the children pushed last first, so tags come off it in document order
+    pending = scope.find_all(True, recursive=False)
+    pending.reverse()
+    while pending:
+        tag = pending.pop()
+        names = tag.get('itemprop')
+        if names:
+            value = microdataItem(tag) if 'itemscope' in tag.attrs else microdataValue(tag)
+            for name in (names.split() if isinstance(names, str) else names):
+                addValue(item['properties'], name, value)
+        if 'itemscope' not in tag.attrs:
+            # Properties of a nested item belong to it, not to this one
+            children = tag.find_all(True, recursive=False)
+            children.reverse()
+            pending.extend(children)
+    return item
+
+
+def microdataValue(tag):
+    attribute = MICRODATA_VALUES.get(tag.name)
+    if attribute is not None and tag.get(attribute) is not None:
+        return tag[attribute]
+    return ' '.join(tag.get_text().split())
+
+
+def addValue(values, key, value):
+    if key not in values:
+        values[key] = value
+    elif isinstance(values[key], list):
+        values[key].append(value)
+    else:
+        values[key] = [values[key], value]
+
+
+def parseJsonLd(text):
+    '''
+    Returns the objects in one JSON-LD block as a list, [] when the block is not valid JSON
+    '''
+    text = text.strip()
+    # Some sites still wrap script contents in comment or CDATA markers for very old browsers
+    for start, end in (('<!--', '-->'), ('//<![CDATA[', '//]]>'), ('<![CDATA[', ']]>')):
+        if text.startswith(start) and text.endswith(end):
+            text = text[len(start):-len(end)].strip()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return []
+    return data if isinstance(data, list) else [data]
+
+
+def scanJsonLd(markup):
+    '''
+    Finds the JSON-LD blocks with a regex over the raw html, so no tree is built at all. markup is a str or
+    the page's bytes.
+    '''
+    if isinstance(markup, bytes):
+        markup = markup.decode(sniffEncoding({}, markup), 'replace')
+    found = []
+    for match in JSON_LD.finditer(markup):
+        found.extend(parseJsonLd(match.group(1)))
+    return found
+
+
+class ContactScanner(Extractor):
+    '''
+    Finds emails and phone numbers in the page's visible text with one regex pass. The strings are collected
+    in a PageText, so a number split over inline tags such as <b>555</b>-123-4567 is still found while the
+    edges of every string still count as boundaries, and every pattern is tried at once as one alternation.
+    Returns {name: [matches]} without duplicates, or just the list for one name when only is given.
+    Emails are also taken from mailto: links, data-* attributes and email_attributes during the same
+    traversal, and every address goes through normalizeEmail() before duplicates are dropped.
+    With sources the result also has a 'sources' entry mapping every match to the document strings it was read
+    from, or the tags whose attributes held it, through PageText.locate().
+    '''
+    def __init__(self, patterns=None, only=None, email_attributes=EMAIL_ATTRIBUTES, sources=False):
+        self.patterns = CONTACT_PATTERNS if patterns is None else patterns
+        self.version = '4-' + fingerprint([sorted(self.patterns.items()), sorted(email_attributes)])
+        self.only = only
+        self.email_attributes = email_attributes if 'emails' in self.patterns and only in (None, 'emails') else ()
+        self.page_text = PageText()
+        self.found = {name: [] for name in self.patterns}
+        self.seen = {}
+        self.sources = {} if sources else None
+
+    def tag(self, tag):
+        self.page_text.tag(tag)
+        if self.email_attributes and tag.attrs:
+            for attribute, value in tag.attrs.items():
+                if not isinstance(value, str):
+                    continue
+                if attribute == 'href':
+                    if value[:7].lower() == 'mailto:':
+                        # mailto:a@x.com,b@y.com?subject=... with the addresses percent-encoded
+                        for address in unquote(value[7:].split('?', 1)[0]).split(','):
+                            self.emailsIn(address, tag)
+                elif attribute.startswith('data-') or attribute in self.email_attributes:
+                    self.emailsIn(value, tag)
+
+    def text(self, string):
+        self.page_text.text(string)
+
+    def emailsIn(self, value, tag):
+        if '@' in value or '[' in value or '(' in value or '&' in value:
+            for match in combinedPattern({'emails': self.patterns['emails']}).finditer(html.unescape(value)):
+                self.keep('emails', match.group(0), [tag])
+
+    def keep(self, name, value, nodes):
+        if name == 'emails':
+            value = normalizeEmail(value)
+            key = (name, value.lower())
+        else:
+            value = ' '.join(value.split())
+            if not 7 <= sum(x.isdigit() for x in value) <= 15:
+                return
+            key = (name, value)
+        if key not in self.seen:
+            self.seen[key] = value
+            self.found[name].append(value)
+        if self.sources is not None:
+            sources = self.sources.setdefault(self.seen[key], [])
+            sources.extend(x for x in nodes if not any(x is y for y in sources))
+
+    def result(self):
+        for offset, match in self.page_text.matches(combinedPattern(self.patterns)):
+            nodes = () if self.sources is None else self.page_text.locate(offset, offset + len(match.group(0)))
+            self.keep(match.lastgroup, match.group(0), nodes)
+        if self.only is not None:
+            return self.found[self.only]
+        return self.found if self.sources is None else dict(self.found, sources=self.sources)
+
+
+def normalizeEmail(address):
+    '''
+    Turns 'Jane [at] Example (dot) COM' into 'Jane@example.com': obfuscated @ and dots are decoded and the
+    domain, which is case insensitive, is lower cased
+    '''
+    address = OBFUSCATED_DOT.sub('.', OBFUSCATED_AT.sub('@', address.strip()))
+    local, at, domain = address.rpartition('@')
+    return local + at + domain.lower()
+
+
+def fingerprint(value):
+    '''
+    Short stable digest of a JSON serializable value
+    '''
+    data = json.dumps(value, sort_keys=True, default=repr).encode('utf-8')
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+compiled_patterns = {}
+
+def combinedPattern(patterns):
+    '''
+    Compiles {name: regex} into one alternation of named groups, once per set of patterns
+    '''
+    key = tuple(patterns.items())
+    if key not in compiled_patterns:
+        compiled_patterns[key] = re.compile('|'.join('(?P<{0}>{1})'.format(name, pattern)
+                                                     for name, pattern in patterns.items()))
+    return compiled_patterns[key]
+
+
+class PageText:
+    '''
+    The visible text of a page, fed the same tag() and text() calls as an extractor. The strings are joined
+    into one buffer, broken wherever a block tag starts or ends, so a regex can match across inline tags but
+    not between blocks. Strings that run into a neighbour without whitespace are also searched on their own
+    and those matches win, see matches(). starts and nodes map buffer offsets back to the strings, see locate().
+    '''
+    def __init__(self):
+        self.pieces = []
+        self.starts = []
+        self.nodes = []
+        self.length = 0
+        self.previous = None
+        self.parent = None
+        self.block = None
+        # {offset: string} of the strings that run into a neighbour without whitespace between them
+        self.touching = {}
+
+    def tag(self, tag):
+        if tag.name in BLOCK_TAGS:
+            self.breakText()
+
+    def text(self, string):
+        # Comments, doctypes and CDATA have a PREFIX, plain strings do not
+        if string.PREFIX or (string.parent is not None and string.parent.name in HIDDEN_TAGS) or not string:
+            return
+        if string.parent is not self.parent:
+            # tag() only sees blocks open, a string in another block than the last one means a block closed
+            self.parent = string.parent
+            block = self.parent
+            while block is not None and block.name not in BLOCK_TAGS:
+                block = block.parent
+            if block is not self.block:
+                self.block = block
+                self.breakText()
+        text = str(string)
+        if self.previous is not None and not self.previous[1][-1].isspace() and not text[0].isspace():
+            self.touching[self.previous[0]] = self.previous[1]
+            self.touching[self.length] = text
+        self.previous = (self.length, text)
+        self.add(text, string)
+
+    def breakText(self):
+        # One newline is enough however many blocks start or end in a row
+        if self.pieces and self.nodes[-1] is not None:
+            self.add('\n', None)
+        self.previous = None
+
+    def add(self, text, node):
+        self.starts.append(self.length)
+        self.pieces.append(text)
+        self.nodes.append(node)
+        self.length += len(text)
+
+    def locate(self, start, end):
+        '''
+        Returns the strings of the document that the buffer range start:end was built from
+        '''
+        first = bisect.bisect_right(self.starts, start) - 1
+        last = bisect.bisect_left(self.starts, end)
+        return [x for x in self.nodes[first:last] if x is not None]
+
+    def matches(self, pattern):
+        '''
+        Returns (offset, match) for the matches of pattern in document order, offset being where the match
+        starts in the buffer. A string that touches a neighbour is searched on its own, so a match may end or
+        start at its edge: Phone:<span>555-123-4567</span>Fax: finds the number although the letters around it
+        fail a lookaround in the joined text. A match of the joined text that overlaps one of those is dropped,
+        so only matches that bridge strings where nothing else was found, as <b>555</b>-123-4567, come from
+        the joined text there.
+        '''
+        joined = [(x.start(), x) for x in pattern.finditer(''.join(self.pieces))]
+        if not self.touching:
+            return joined
+        alone = []
+        for offset, text in self.touching.items():
+            alone.extend((offset + x.start(), x) for x in pattern.finditer(text))
+        # Matches within one string never overlap, and each string comes after the last, so ends are sorted too
+        ends = [offset + len(x.group(0)) for offset, x in alone]
+        found = list(alone)
+        for offset, match in joined:
+            index = bisect.bisect_right(ends, offset)
+            if index == len(alone) or alone[index][0] >= offset + len(match.group(0)):
+                found.append((offset, match))
+        found.sort(key=lambda x: x[0])
+        return found
+
+
+class ExtractionEngine:
+    '''
+    Holds named extractor factories and runs any subset of them over a document in one traversal
+    '''
+    def __init__(self, factories=None):
+        self.factories = dict(factories or {})
+
+    def register(self, name, factory):
+        self.factories[name] = factory
+
+    def key(self, names=None):
+        '''
+        Result cache key for running the named extractors: each name with its extractor's version
+        '''
+        names = list(self.factories) if names is None else names
+        return ','.join(sorted('{0}:{1}'.format(name, self.factories[name]().version) for name in names))
+
+    def strainers(self, names=None):
+        names = list(self.factories) if names is None else names
+        specs = []
+        for name in names:
+            strainer = self.factories[name]().strainer
+            specs.extend(strainer if isinstance(strainer, list) else [strainer])
+        return specs
+
+    def run(self, document, names=None, metrics=None):
+        '''
+        Runs the named extractors over the document in one traversal. With a metrics.Metrics the time spent in
+        each extractor is recorded as 'extract.<name>', which costs a clock read per node and extractor.
+        '''
+        from bs4.element import NavigableString, Tag
+        names = list(self.factories) if names is None else names
+        extractors = [(name, self.factories[name]()) for name in names]
+        tag_handlers = [(name, x.tag) for name, x in extractors if type(x).tag is not Extractor.tag]
+        text_handlers = [(name, x.text) for name, x in extractors if type(x).text is not Extractor.text]
+        if metrics is None:
+            tag_calls = [handler for name, handler in tag_handlers]
+            text_calls = [handler for name, handler in text_handlers]
+        else:
+            spent = dict((name, 0.0) for name in names)
+            tag_calls = [self.timed(name, handler, spent) for name, handler in tag_handlers]
+            text_calls = [self.timed(name, handler, spent) for name, handler in text_handlers]
+        for node in document.descendants:
+            if isinstance(node, Tag):
+                for handler in tag_calls:
+                    handler(node)
+            elif isinstance(node, NavigableString):
+                for handler in text_calls:
+                    handler(node)
+        if metrics is not None:
+            for name, seconds in spent.items():
+                metrics.record('extract.' + name, seconds * 1000)
+        return {name: x.result() for name, x in extractors}
+
+    def timed(self, name, handler, spent):
+        def call(node):
+            start = time.perf_counter()
+            handler(node)
+            spent[name] += time.perf_counter() - start
+        return call
+
+
+class ContactStream:
+    '''
+    Runs regexes straight over decoded html as it arrives, with tags stripped and entities decoded, so no
+    tree is ever built. Only the last overlap characters of text are kept between chunks, which is enough for
+    a match that straddles two chunks, so memory stays constant however large the page is.
+    '''
+    def __init__(self, patterns, encoding='utf-8', overlap=256):
+        self.patterns = patterns
+        self.decoder = codecs.getincrementaldecoder(encoding)('replace')
+        self.overlap = overlap
+        self.markup = ''
+        self.text = ''
+        self.offset = 0
+        self.found = {name: [] for name in patterns}
+        self.scanned = {name: 0 for name in patterns}
+
+    def feed(self, chunk):
+        markup = self.markup + self.decoder.decode(chunk)
+        # Hold back a tag, comment or entity that is cut off at the end of the chunk
+        cut = len(markup)
+        tag_start = markup.rfind('<')
+        if tag_start != -1 and markup.find('>', tag_start) == -1:
+            cut = tag_start
+        comment_start = markup.rfind('<!--')
+        if comment_start != -1 and markup.find('-->', comment_start) == -1:
+            cut = min(cut, comment_start)
+        entity_start = markup.rfind('&', 0, cut)
+        if entity_start != -1 and cut - entity_start < 12 and ';' not in markup[entity_start:cut]:
+            cut = entity_start
+        markup, self.markup = markup[:cut], markup[cut:]
+        self.text += html.unescape(MARKUP.sub(' ', markup))
+        self.scan(False)
+
+    def close(self):
+        self.text += html.unescape(MARKUP.sub(' ', self.markup + self.decoder.decode(b'', True)))
+        self.markup = ''
+        self.scan(True)
+        return self.found
+
+    def scan(self, final):
+        limit = len(self.text) if final else len(self.text) - self.overlap
+        keep_from = max(limit, 0)
+        for name, pattern in self.patterns.items():
+            for match in pattern.finditer(self.text, max(self.scanned[name] - self.offset, 0)):
+                if match.end() >= limit and not final:
+                    # The match could still grow with the next chunk, so look at it again then
+                    keep_from = min(keep_from, match.start())
+                    break
+                self.found[name].append(match.group(0))
+                self.scanned[name] = self.offset + match.end()
+        if not final and keep_from > 0:
+            self.text = self.text[keep_from:]
+            self.offset += keep_from
+
+
+def sniffEncoding(headers, first_chunk, default='utf-8'):
+    '''
+    Picks the encoding from the Content-Type header, then from a meta charset near the top of the page
+    '''
+    for source in (headers.get('Content-Type', '').encode('ascii', 'ignore'), first_chunk[:2048]):
+        match = CHARSET.search(source)
+        if match:
+            try:
+                return codecs.lookup(match.group(1).decode('ascii')).name
+            except LookupError:
+                pass
+    return default
@@ -0,0 +1,293 @@
+'''
+Fetch layer used by the Executive. Any object with a fetch(url) method that returns the page body as bytes and
+raises urllib's HTTPError/URLError on failure can be plugged in; valid_links, streamContacts and CachingFetcher
+also need request(url, headers) and stream(url, chunk_size) like Fetcher has.
+'''
+from urllib.error import HTTPError, URLError
+import threading
+import time
+import zlib
+
+# Compressed bodies are decoded by Fetcher.bodyChunks with an output cap
+DEFAULT_HEADERS = {'User-Agent': 'Mozilla/5.0 (compatible; WebScraping/1.0)', 'Accept-Encoding': 'gzip, deflate'}
+
+
+class ResponseTooLarge(URLError):
+    '''
+    Raised when a body goes over the fetcher's size limits and oversize is 'abort'
+    '''
+    def __init__(self, url, limit):
+        URLError.__init__(self, limit)
+        self.url = url
+
+
+class Response:
+    '''
+    Status, headers and body of a finished request
+    '''
+    def __init__(self, status, reason, headers, data):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.data = data
+
+
+class Fetcher:
+    '''
+    Fetches pages through one long-lived urllib3 PoolManager so repeated requests to a host reuse warm
+    keep-alive connections instead of paying for a new TCP and TLS handshake every time.
+    num_pools is how many hosts keep a pool and maxsize is how many idle connections each pool holds on to.
+    With a scheduler.AdaptiveRateLimiter every request waits for a token and reports its status back, and
+    429/503 responses are retried up to retries times once the limiter lets the host be contacted again.
+    Bodies are capped at max_bytes on the wire and max_decompressed_bytes once decompressed, so a huge page or
+    a gzip bomb cannot exhaust a worker's memory; oversize is 'truncate' to keep what was read or 'abort'.
+    '''
+    def __init__(self, num_pools=32, maxsize=8, timeout=30, retries=2, headers=None, limiter=None,
+                 max_bytes=20 * 1024 * 1024, max_decompressed_bytes=50 * 1024 * 1024, oversize='truncate', metrics=None):
+        self.headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self.limiter = limiter
+        self.metrics = metrics
+        self.max_bytes = max_bytes
+        self.max_decompressed_bytes = max_decompressed_bytes
+        self.oversize = oversize
+        self.local = threading.local()
+        self.num_pools = num_pools
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.retries = retries
+        self.pool = None
+        self.pool_lock = threading.Lock()
+
+    def connectionPool(self):
+        '''
+        Creates the PoolManager on first use so that importing urllib3 is only paid for once something is fetched
+        '''
+        if self.pool is None:
+            with self.pool_lock:
+                if self.pool is None:
+                    import urllib3
+                    retries = self.retries
+                    if self.limiter is not None:
+                        # urllib3 would retry a 429/503 with Retry-After itself and the limiter would never see it,
+                        # request() retries those once the limiter lets the host be contacted again
+                        retries = urllib3.util.retry.Retry(self.retries, respect_retry_after_header=False)
+                    pool = urllib3.PoolManager(num_pools=self.num_pools, maxsize=self.maxsize, headers=self.headers,
+                                               timeout=urllib3.Timeout(total=self.timeout), retries=retries)
+                    if self.metrics is not None:
+                        from metrics import instrumentedPoolClasses
+                        pool.pool_classes_by_scheme = instrumentedPoolClasses(self.metrics)
+                    self.pool = pool
+        return self.pool
+
+    def fetch(self, url):
+        response = self.request(url)
+        if response.status >= 400:
+            raise HTTPError(url, response.status, response.reason, response.headers, None)
+        return response.data
+
+    def request(self, url, headers=None):
+        '''
+        Sends a GET with optional extra headers and returns a Response whatever its status. The body is read
+        within the size limits, see readBody.
+        '''
+        pool = self.connectionPool()
+        import urllib3
+        from urllib3.util.retry import Retry
+        retry = Retry(total=self.retries, status_forcelist=(429, 503), respect_retry_after_header=True)
+        while True:
+            if self.limiter is not None:
+                self.limiter.acquire(url)
+            start = time.perf_counter()
+            try:
+                response = pool.request('GET', url, headers=dict(self.headers, **headers) if headers else None,
+                                        preload_content=False)
+            except urllib3.exceptions.HTTPError as e:
+                raise URLError(e)
+            if self.metrics is not None:
+                self.metrics.record('ttfb', (time.perf_counter() - start) * 1000)
+                self.metrics.count('requests')
+            if self.limiter is None:
+                break
+            self.limiter.record(url, response.status, retry.get_retry_after(response))
+            if not retry.is_retry('GET', response.status, response.headers.get('Retry-After') is not None):
+                break
+            try:
+                retry = retry.increment('GET', url, response)
+            except urllib3.exceptions.MaxRetryError:
+                break
+            response.drain_conn()
+            response.release_conn()
+        return Response(response.status, response.reason, response.headers, self.readBody(url, response))
+
+    def readBody(self, url, response):
+        '''
+        Reads a whole response body within the size limits, see bodyChunks()
+        '''
+        self.checkLength(url, response)
+        return b''.join(self.bodyChunks(url, response))
+
+    def checkLength(self, url, response):
+        length = response.headers.get('Content-Length')
+        if length is not None and length.isdigit() and int(length) > self.max_bytes and self.oversize == 'abort':
+            response.close()
+            raise ResponseTooLarge(url, 'Content-Length over max_bytes')
+
+    def bodyChunks(self, url, response, chunk_size=16 * 1024):
+        '''
+        Yields a response body chunk by chunk while counting both the bytes on the wire and the decompressed
+        bytes. When either goes over its limit the connection is dropped and the body is cut short, or
+        ResponseTooLarge is raised if oversize is 'abort'. What happened is kept for lastFetch().
+        '''
+        import urllib3
+        info = {'url': url, 'status': response.status, 'raw_bytes': 0, 'bytes': 0, 'truncated': None}
+        self.local.info = info
+        encoding = response.headers.get('Content-Encoding', '').lower().strip()
+        # gzip and deflate are decompressed here with an output cap, so a bomb never expands past the limit
+        decoder = zlib.decompressobj(zlib.MAX_WBITS | 32) if encoding in ('gzip', 'x-gzip', 'deflate') else None
+        download_seconds = decompress_seconds = 0
+        finished = False
+        try:
+            raw_chunks = response.stream(chunk_size, decode_content=decoder is None)
+            while True:
+                start = time.perf_counter()
+                chunk = next(raw_chunks, None)
+                download_seconds += time.perf_counter() - start
+                room = self.max_decompressed_bytes - info['bytes']
+                if chunk is None:
+                    if decoder is None:
+                        break
+                    chunk = decoder.flush()
+                    decoder = None
+                else:
+                    info['raw_bytes'] = response.tell()
+                    if decoder is not None:
+                        start = time.perf_counter()
+                        try:
+                            chunk = decoder.decompress(chunk, room + 1)
+                        except zlib.error:
+                            if encoding != 'deflate' or info['bytes'] or decoder.unused_data:
+                                raise
+                            # Some servers send deflate without the zlib header, as raw deflate
+                            decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+                            chunk = decoder.decompress(chunk, room + 1)
+                        decompress_seconds += time.perf_counter() - start
+                if len(chunk) > room:
+                    chunk = chunk[:room]
+                    info['truncated'] = 'decompressed body over max_decompressed_bytes'
+                elif info['raw_bytes'] > self.max_bytes:
+                    info['truncated'] = 'body over max_bytes'
+                info['bytes'] += len(chunk)
+                if info['truncated'] and self.oversize == 'abort':
+                    raise ResponseTooLarge(url, info['truncated'])
+                if chunk:
+                    yield chunk
+                if info['truncated']:
+                    break
+            finished = info['truncated'] is None
+        except (urllib3.exceptions.HTTPError, zlib.error) as e:
+            raise URLError(e)
+        finally:
+            if finished:
+                response.release_conn()
+            else:
+                # The rest of the body is still on the wire, so the connection cannot go back to the pool
+                response.close()
+            if self.metrics is not None:
+                self.metrics.record('download', download_seconds * 1000)
+                if encoding in ('gzip', 'x-gzip', 'deflate'):
+                    self.metrics.record('decompress', decompress_seconds * 1000)
+                self.metrics.count('raw_bytes', info['raw_bytes'])
+                self.metrics.count('bytes', info['bytes'])
+                if info['truncated']:
+                    self.metrics.count('truncated')
+
+    def lastFetch(self):
+        '''
+        Returns what happened to the last body read on this thread: url, status, raw_bytes, bytes and truncated,
+        which names the limit that was hit or is None
+        '''
+        return getattr(self.local, 'info', None)
+
+    def stream(self, url, chunk_size=64 * 1024):
+        '''
+        Returns the response headers and an iterator over the body, read chunk_size bytes at a time from the
+        wire, without holding the whole body in memory. The same size limits as fetch() apply.
+        '''
+        pool = self.connectionPool()
+        import urllib3
+        if self.limiter is not None:
+            self.limiter.acquire(url)
+        try:
+            response = pool.request('GET', url, preload_content=False)
+        except urllib3.exceptions.HTTPError as e:
+            raise URLError(e)
+        if self.limiter is not None:
+            self.limiter.record(url, response.status)
+        if response.status >= 400:
+            response.release_conn()
+            raise HTTPError(url, response.status, response.reason, response.headers, None)
+        self.checkLength(url, response)
+        return response.headers, self.bodyChunks(url, response, chunk_size)
+
+    def stats(self):
+        '''
+        Returns how many host pools are open and how many connections and requests they have handled.
+        A connection count well below the request count means keep-alive is doing its job.
+        '''
+        pools = [] if self.pool is None else [self.pool.pools[key] for key in self.pool.pools.keys()]
+        return {'pools': len(pools),
+                'connections': sum(x.num_connections for x in pools),
+                'requests': sum(x.num_requests for x in pools),
+                'idle': sum(1 for x in pools if x.pool is not None for c in list(x.pool.queue) if c is not None)}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.clear()
+
+
+class CachingFetcher:
+    '''
+    Wraps a Fetcher with an on-disk cache.HttpCache. Fresh entries are served without a request, stale ones are
+    revalidated with If-None-Match / If-Modified-Since and served from disk when the server answers 304.
+    '''
+    def __init__(self, fetcher, http_cache):
+        self.fetcher = fetcher
+        self.http_cache = http_cache
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def fetch(self, url):
+        cached = self.http_cache.lookup(url)
+        if cached is not None and cached[0]['fresh']:
+            self.hits += 1
+            return cached[1]
+        headers = self.http_cache.conditionalHeaders(cached[0]) if cached is not None else None
+        response = self.fetcher.request(url, headers)
+        if response.status == 304 and cached is not None:
+            self.revalidated += 1
+            self.http_cache.refresh(url, response.headers, cached[0])
+            return cached[1]
+        if response.status >= 400:
+            raise HTTPError(url, response.status, response.reason, response.headers, None)
+        self.misses += 1
+        info = self.lastFetch()
+        if info is None or info['url'] != url or not info['truncated']:
+            self.http_cache.store(url, response.headers, response.data)
+        return response.data
+
+    def lastFetch(self):
+        return self.fetcher.lastFetch() if hasattr(self.fetcher, 'lastFetch') else None
+
+    def stream(self, url, chunk_size=64 * 1024):
+        return self.fetcher.stream(url, chunk_size)
+
+    def request(self, url, headers=None):
+        return self.fetcher.request(url, headers)
+
+    def stats(self):
+        return dict(self.fetcher.stats(), cache_hits=self.hits, cache_revalidated=self.revalidated,
+                    cache_misses=self.misses, cache_bytes=self.http_cache.total_bytes)
+
+    def close(self):
+        self.fetcher.close()
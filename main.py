@@ -1,7 +1,75 @@
 from executive import Executive
-def main():
+from sinks import openSink, ThreadedSink
+import argparse
+import contextlib
+import json
+import sys
+
+def readUrls(source):
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+def batch(args):
     my_exec = Executive()
-    my_exec.start()
+    names = args.extractors.split(',')
+    if args.template:
+        with open(args.template, encoding='utf-8') as f:
+            names.append(my_exec.addTemplate(json.load(f)))
+    unknown = [x for x in names if x not in my_exec.engine.factories]
+    if unknown:
+        sys.exit('Unknown extractors: ' + ', '.join(unknown))
+
+    def extract(url):
+        return my_exec.extract(url, names)
+
+    def records(urls):
+        if args.processes:
+            for url, record in my_exec.crawlProcesses(urls, names, args.processes, args.workers, args.per_host):
+                yield url, record, 'fetch failed', None if record is None else record.pop('truncated', None)
+        else:
+            for url, results in my_exec.crawl(urls, [extract], args.workers, args.per_host):
+                yield (url, results['extract'], results.get('errors', {}).get('extract', 'fetch failed'),
+                       results.get('truncated'))
+
+    source = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+    fields = ['url'] + names + ['error', 'truncated']
+    output = ThreadedSink(openSink(args.output, fields, args.batch_size or (1 if args.output == '-' else 500)))
+    try:
+        # The getters print their errors, keep those off stdout so the JSON lines stay parseable
+        with contextlib.redirect_stdout(sys.stderr):
+            for url, result, error, truncated in records(readUrls(source)):
+                record = {'url': url}
+                if result is not None:
+                    record.update(result)
+                else:
+                    record['error'] = error
+                if truncated:
+                    # The page was cut at a size limit, so the results only cover its beginning
+                    record['truncated'] = truncated
+                output.write(record)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        output.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract data from web pages. Runs the interactive menu unless --batch is given.')
+    parser.add_argument('--batch', metavar='FILE', help="file with one url per line, or '-' for stdin")
+    parser.add_argument('--extractors', default='emails,phones,links', help='comma separated list of: emails, phones, contacts, links, title, jsonld, opengraph, microdata')
+    parser.add_argument('--template', metavar='FILE', help='JSON extraction template (see templates.py) to apply to every page')
+    parser.add_argument('--output', default='-', help="output file: .csv, .db/.sqlite for SQLite, anything else JSON lines, '-' for stdout")
+    parser.add_argument('--batch-size', type=int, default=0, help='results buffered per write (default 1 for stdout, 500 for files)')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--per-host', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=0, help='parse pages in this many processes instead of on the fetch threads')
+    args = parser.parse_args()
+    if args.batch is None:
+        my_exec = Executive()
+        my_exec.start()
+    else:
+        batch(args)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,138 @@
+'''
+Timing and counters for the fetch, parse and extract stages of the Executive. Stages are recorded in
+milliseconds under names such as 'dns', 'connect', 'tls', 'ttfb', 'download', 'decompress', 'encoding',
+'tree_build' and 'extract.<name>'.
+'''
+import threading
+import time
+from contextlib import contextmanager
+
+SAMPLE_SIZE = 1024
+
+
+class Metrics:
+    '''
+    Thread-safe collector. Every stage keeps a count, total and max, plus the last SAMPLE_SIZE timings for
+    percentiles. When a trace is started on a thread, that thread's timings are also collected into a per-page
+    trace record.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.local = threading.local()
+
+    def record(self, stage, ms):
+        with self.lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = self.stages[stage] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'samples': [], 'next': 0}
+            entry['count'] += 1
+            entry['total_ms'] += ms
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            if len(entry['samples']) < SAMPLE_SIZE:
+                entry['samples'].append(ms)
+            else:
+                entry['samples'][entry['next']] = ms
+                entry['next'] = (entry['next'] + 1) % SAMPLE_SIZE
+        trace = getattr(self.local, 'trace', None)
+        if trace is not None:
+            trace['stages'][stage] = round(trace['stages'].get(stage, 0) + ms, 3)
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - start) * 1000)
+
+    def startTrace(self, url):
+        self.local.trace = {'url': url, 'stages': {}}
+
+    def endTrace(self):
+        trace = getattr(self.local, 'trace', None)
+        self.local.trace = None
+        return trace
+
+    def snapshot(self):
+        '''
+        Returns {'stages': {stage: count, total, mean, p50, p99 and max in ms}, 'counters': {...}}
+        '''
+        with self.lock:
+            stages = {}
+            for stage, entry in self.stages.items():
+                samples = sorted(entry['samples'])
+                stages[stage] = {'count': entry['count'],
+                                 'total_ms': round(entry['total_ms'], 3),
+                                 'mean_ms': round(entry['total_ms'] / entry['count'], 3),
+                                 'p50_ms': round(samples[len(samples) // 2], 3),
+                                 'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+                                 'max_ms': round(entry['max_ms'], 3)}
+            return {'stages': stages, 'counters': dict(self.counters)}
+
+    def reset(self):
+        with self.lock:
+            self.stages.clear()
+            self.counters.clear()
+
+
+def instrumentedPoolClasses(metrics):
+    '''
+    Returns urllib3 pool classes for PoolManager.pool_classes_by_scheme whose connections time DNS lookup,
+    TCP connect and the TLS handshake separately
+    '''
+    import socket
+    from urllib3 import connection, connectionpool, exceptions
+    from urllib3.util.connection import create_connection
+
+    class TimedConnection:
+        def _new_conn(self):
+            start = time.perf_counter()
+            try:
+                addresses = socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+            except socket.gaierror as e:
+                raise exceptions.NewConnectionError(self, 'Failed to establish a new connection: %s' % e)
+            finally:
+                self.dns_ms = (time.perf_counter() - start) * 1000
+                metrics.record('dns', self.dns_ms)
+            start = time.perf_counter()
+            error = None
+            try:
+                for family, socktype, proto, canonname, address in addresses:
+                    try:
+                        conn = create_connection(address[:2], self.timeout, source_address=self.source_address,
+                                                 socket_options=self.socket_options)
+                        self.connect_ms = (time.perf_counter() - start) * 1000
+                        metrics.record('connect', self.connect_ms)
+                        return conn
+                    except socket.timeout:
+                        raise exceptions.ConnectTimeoutError(
+                            self, 'Connection to %s timed out. (connect timeout=%s)' % (self.host, self.timeout))
+                    except OSError as e:
+                        error = e
+                raise exceptions.NewConnectionError(self, 'Failed to establish a new connection: %s' % error)
+            finally:
+                metrics.count('connections')
+
+    class TimedHTTPConnection(TimedConnection, connection.HTTPConnection):
+        pass
+
+    class TimedHTTPSConnection(TimedConnection, connection.HTTPSConnection):
+        def connect(self):
+            self.dns_ms = self.connect_ms = 0
+            start = time.perf_counter()
+            connection.HTTPSConnection.connect(self)
+            metrics.record('tls', (time.perf_counter() - start) * 1000 - self.dns_ms - self.connect_ms)
+
+    class TimedHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    return {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
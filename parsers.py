@@ -0,0 +1,116 @@
+'''
+Parser backend selection for BeautifulSoup. Run this file with a directory of html files to compare the
+available tree builders on your own pages:
+
+python parsers.py corpus_dir
+'''
+import os
+import sys
+import time
+import tracemalloc
+
+# In the order they are usually fastest, used when there is no time to measure
+PARSERS = ('lxml', 'html.parser', 'html5lib')
+
+SAMPLE = ('<html><head><title>Sample</title></head><body>'
+          + '<div class="item"><a href="/page">link</a><p>Some text &amp; more, call 555-123-4567</p></div>' * 200
+          + '</body></html>')
+
+chosen_parser = None
+
+
+def availableParsers():
+    '''
+    Returns the parsers from PARSERS that have a registered, importable tree builder
+    '''
+    from bs4.builder import builder_registry
+    return [x for x in PARSERS if builder_registry.lookup(x) is not None]
+
+
+def timeParser(parser, pages, rounds=1):
+    from bs4 import BeautifulSoup
+    start = time.perf_counter()
+    for i in range(rounds):
+        for page in pages:
+            BeautifulSoup(page, parser)
+    return time.perf_counter() - start
+
+
+def autoParser():
+    '''
+    Times every available builder on a small sample page the first time it is called and returns the fastest
+    '''
+    global chosen_parser
+    if chosen_parser is None:
+        timings = {}
+        for parser in availableParsers():
+            try:
+                timings[parser] = timeParser(parser, [SAMPLE], 3)
+            except Exception:
+                continue
+        chosen_parser = min(timings, key=timings.get) if timings else 'html.parser'
+    return chosen_parser
+
+
+def resolveParser(parser):
+    '''
+    Turns a parser setting into a parser name BeautifulSoup accepts, falling back to the built in html.parser
+    when the requested builder is not installed
+    '''
+    if parser == 'auto':
+        return autoParser()
+    from bs4.builder import builder_registry
+    if builder_registry.lookup(parser) is None:
+        return 'html.parser'
+    return parser
+
+
+def combineStrainers(specs):
+    '''
+    Builds one SoupStrainer that keeps every tag matched by any of the (name, attrs) specs. Returns None, meaning
+    the whole document has to be built, when there are no specs or one of them is None.
+    '''
+    if not specs or any(x is None for x in specs):
+        return None
+    from bs4 import SoupStrainer
+    strainers = [SoupStrainer(name, attrs) for name, attrs in specs]
+    if len(strainers) == 1:
+        return strainers[0]
+    return SoupStrainer(lambda name, attrs: any(x.search_tag(name, attrs) for x in strainers))
+
+
+def strainerKey(specs):
+    return repr(sorted(set(repr(x) for x in specs)))
+
+
+def benchmark(pages, parsers=None):
+    '''
+    Parses every page with each builder and returns pages per second and peak traced memory for each one
+    '''
+    from bs4 import BeautifulSoup
+    report = {}
+    for parser in parsers or availableParsers():
+        seconds = timeParser(parser, pages)
+        tracemalloc.start()
+        for page in pages:
+            BeautifulSoup(page, parser)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report[parser] = {'pages_per_sec': round(len(pages) / seconds, 2) if seconds else None,
+                          'peak_memory_mb': round(peak / (1024 * 1024), 2)}
+    return report
+
+
+def loadCorpus(directory):
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(directory, name), 'rb') as f:
+                pages.append(f.read())
+    return pages
+
+
+if __name__ == '__main__':
+    corpus = loadCorpus(sys.argv[1]) if len(sys.argv) > 1 else [SAMPLE.encode('utf-8')] * 20
+    for parser, result in benchmark(corpus).items():
+        print('{0:12} {1:>10} pages/sec {2:>10} MB peak'.format(parser, result['pages_per_sec'], result['peak_memory_mb']))
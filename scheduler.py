@@ -0,0 +1,219 @@
+'''
+Politeness helpers for Executive.crawl: a cache of parsed robots.txt rules, an adaptive per-host rate limiter
+and a per-host scheduler that hands out urls only when their host is allowed another request.
+'''
+import threading
+import time
+from collections import OrderedDict, deque
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+
+def hostOf(url):
+    parts = urlsplit(url)
+    return parts.scheme.lower() + '://' + parts.netloc.lower()
+
+
+class RobotsCache:
+    '''
+    Fetches and parses robots.txt once per host and keeps the rules for ttl seconds. A missing robots.txt
+    (4xx) or an unreachable server allows everything, a server error (5xx) disallows everything until the
+    entry expires.
+    '''
+    def __init__(self, fetcher, user_agent='*', ttl=3600):
+        self.fetcher = fetcher
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.rules = {}
+        self.lock = threading.Lock()
+
+    def known(self, url):
+        '''
+        Returns True if the rules for the url's host are loaded and not expired
+        '''
+        entry = self.rules.get(hostOf(url))
+        return entry is not None and entry[1] > time.monotonic()
+
+    def parser(self, url):
+        host = hostOf(url)
+        entry = self.rules.get(host)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        rules = RobotFileParser(host + '/robots.txt')
+        try:
+            body = self.fetcher.fetch(host + '/robots.txt')
+            rules.parse(body.decode('utf-8', 'replace').splitlines())
+        except HTTPError as e:
+            if e.code >= 500:
+                rules.disallow_all = True
+            else:
+                rules.allow_all = True
+        except URLError:
+            rules.allow_all = True
+        with self.lock:
+            self.rules[host] = (rules, time.monotonic() + self.ttl)
+        return rules
+
+    def allowed(self, url):
+        return self.parser(url).can_fetch(self.user_agent, url)
+
+    def crawlDelay(self, url):
+        '''
+        Returns the seconds to wait between requests to the url's host, from Crawl-delay or Request-rate
+        '''
+        rules = self.parser(url)
+        delay = rules.crawl_delay(self.user_agent)
+        rate = rules.request_rate(self.user_agent)
+        if rate is not None and rate.requests:
+            delay = max(delay or 0, rate.seconds / rate.requests)
+        return float(delay or 0)
+
+
+class AdaptiveRateLimiter:
+    '''
+    Token bucket per host whose rate adapts to how the host responds. Every good response adds increase
+    requests/sec to the host's rate up to max_rate, a 429 or 503 multiplies it by decrease down to min_rate and
+    stops all requests to the host until its Retry-After (or one token interval when there is none) has passed.
+    '''
+    def __init__(self, initial_rate=4.0, min_rate=0.1, max_rate=50.0, increase=0.5, decrease=0.5, burst=4):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.burst = burst
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, host, now):
+        if host not in self.buckets:
+            self.buckets[host] = {'rate': self.initial_rate, 'tokens': float(self.burst), 'updated': now, 'blocked_until': 0}
+        bucket = self.buckets[host]
+        bucket['tokens'] = min(self.burst, bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+        bucket['updated'] = now
+        return bucket
+
+    def wait(self, url):
+        '''
+        Returns how many seconds to wait before the url's host can take another request, without using a token
+        '''
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.bucket(hostOf(url), now)
+            return max(bucket['blocked_until'] - now, (1 - bucket['tokens']) / bucket['rate'], 0)
+
+    def acquire(self, url):
+        '''
+        Takes a token for the url's host, sleeping first if none is available yet
+        '''
+        while True:
+            now = time.monotonic()
+            with self.lock:
+                bucket = self.bucket(hostOf(url), now)
+                wait = max(bucket['blocked_until'] - now, (1 - bucket['tokens']) / bucket['rate'], 0)
+                if wait <= 0:
+                    bucket['tokens'] -= 1
+                    return
+            time.sleep(wait)
+
+    def record(self, url, status, retry_after=None):
+        '''
+        Adjusts the host's rate from a response status; retry_after is the server's Retry-After in seconds
+        '''
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.bucket(hostOf(url), now)
+            if status in (429, 503):
+                bucket['rate'] = max(self.min_rate, bucket['rate'] * self.decrease)
+                bucket['tokens'] = 0
+                pause = retry_after if retry_after is not None else 1 / bucket['rate']
+                bucket['blocked_until'] = max(bucket['blocked_until'], now + pause)
+            elif status < 400:
+                bucket['rate'] = min(self.max_rate, bucket['rate'] + self.increase)
+
+    def rates(self):
+        with self.lock:
+            return {host: round(bucket['rate'], 3) for host, bucket in self.buckets.items()}
+
+
+class HostScheduler:
+    '''
+    Queues urls per host and hands them out round robin, never more than per_host at a time to one host and,
+    when robots rules are given, no sooner than the host's crawl delay after the previous request. With a rate
+    limiter a host also waits for its next token. A host that is cooling down is simply skipped so the workers
+    stay busy with other hosts.
+    '''
+    def __init__(self, per_host=4, robots=None, limiter=None, next_time=None):
+        self.per_host = per_host
+        self.robots = robots
+        self.limiter = limiter
+        self.queues = OrderedDict()
+        self.in_flight = {}
+        # Earliest time each host may be asked again. Pass the same dict to later schedulers so a crawl that
+        # runs in several batches keeps the spacing between them.
+        self.next_time = {} if next_time is None else next_time
+        # Hosts whose last request went out before their robots.txt was read, so without their crawl delay
+        self.unspaced = set()
+        self.size = 0
+
+    def add(self, url):
+        host = hostOf(url)
+        if host not in self.queues:
+            self.queues[host] = deque()
+        self.queues[host].append(url)
+        self.size += 1
+
+    def take(self):
+        '''
+        Returns (url, None) for a url that can be fetched now, otherwise (None, seconds until a cooling down host
+        is ready again). seconds is None when every host with queued urls is at its concurrency limit.
+        '''
+        now = time.monotonic()
+        soonest = None
+        for host, queue in self.queues.items():
+            limit, delay = self.limits(queue[0])
+            if self.in_flight.get(host, 0) >= limit:
+                continue
+            wait = self.next_time.get(host, 0) - now
+            if self.limiter is not None:
+                wait = max(wait, self.limiter.wait(queue[0]))
+            if wait > 0:
+                soonest = wait if soonest is None else min(soonest, wait)
+                continue
+            url = queue.popleft()
+            self.size -= 1
+            if queue:
+                self.queues.move_to_end(host)
+            else:
+                del self.queues[host]
+            self.in_flight[host] = self.in_flight.get(host, 0) + 1
+            self.next_time[host] = now + delay
+            if self.robots is not None and not self.robots.known(url):
+                self.unspaced.add(host)
+            return url, None
+        return None, soonest
+
+    def limits(self, url):
+        if self.robots is None:
+            return self.per_host, 0
+        if not self.robots.known(url):
+            # Send one request at a time until the host's robots.txt has been read
+            return 1, 0
+        delay = self.robots.crawlDelay(url)
+        return (1 if delay else self.per_host), delay
+
+    def done(self, url):
+        host = hostOf(url)
+        if host in self.unspaced and self.robots.known(url):
+            # The crawl delay is known now that the first request has read robots.txt, wait it out from here
+            self.unspaced.discard(host)
+            self.next_time[host] = max(self.next_time.get(host, 0), time.monotonic() + self.robots.crawlDelay(url))
+        self.in_flight[host] -= 1
+        if not self.in_flight[host] and host not in self.queues:
+            del self.in_flight[host]
+            if self.next_time.get(host, 0) <= time.monotonic():
+                self.next_time.pop(host, None)
+
+    def __len__(self):
+        return self.size
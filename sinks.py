@@ -0,0 +1,193 @@
+'''
+Result sinks for crawl output. Records are dicts such as {'url': ..., 'emails': [...]} and are buffered and
+written in batches of batch_size. Wrap any sink in a ThreadedSink to write on a background thread; its
+bounded queue makes the crawl wait when the sink falls behind instead of piling results up in memory.
+'''
+import csv
+import json
+import queue
+import sqlite3
+import sys
+import threading
+
+
+def cell(value):
+    '''
+    Turns a record value into something a CSV or SQLite column can hold, lists and dicts become JSON
+    '''
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        return str(value)
+    return json.dumps(value)
+
+
+class Sink:
+    '''
+    Base class for sinks. Subclasses implement writeBatch(records).
+    '''
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.buffer = []
+        self.written = 0
+        self.dropped = set()
+
+    def write(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.writeBatch(self.buffer)
+            self.written += len(self.buffer)
+            self.buffer = []
+
+    def writeBatch(self, records):
+        raise NotImplementedError
+
+    def reportDropped(self, fields, records):
+        '''
+        Warns once per key on stderr when records have keys that fixed columns cannot hold
+        '''
+        for record in records:
+            for key in record:
+                if key not in fields and key not in self.dropped:
+                    self.dropped.add(key)
+                    print('{0}: field {1!r} is not one of the columns {2} and is not written'.format(
+                        type(self).__name__, key, list(fields)), file=sys.stderr)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class JsonlSink(Sink):
+    '''
+    One JSON object per line, path can be a file name, '-' for stdout or an open text file
+    '''
+    def __init__(self, path, batch_size=500):
+        Sink.__init__(self, batch_size)
+        self.owned = isinstance(path, str) and path != '-'
+        self.file = open(path, 'a', encoding='utf-8') if self.owned else (sys.stdout if path == '-' else path)
+
+    def writeBatch(self, records):
+        self.file.write(''.join(json.dumps(x) + '\n' for x in records))
+        self.file.flush()
+
+    def close(self):
+        Sink.close(self)
+        if self.owned:
+            self.file.close()
+
+
+class CsvSink(Sink):
+    '''
+    CSV file with one column per field. Fields default to the keys of the first record; list values are
+    written as JSON. Keys outside the fields are left out with a warning on stderr.
+    '''
+    def __init__(self, path, fields=None, batch_size=500):
+        Sink.__init__(self, batch_size)
+        self.fields = fields
+        self.file = open(path, 'a', newline='', encoding='utf-8')
+        self.writer = None
+
+    def writeBatch(self, records):
+        if self.writer is None:
+            self.fields = self.fields or list(records[0])
+            self.writer = csv.DictWriter(self.file, self.fields, extrasaction='ignore')
+            if self.file.tell() == 0:
+                self.writer.writeheader()
+        self.reportDropped(self.fields, records)
+        self.writer.writerows({k: cell(x.get(k)) for k in self.fields} for x in records)
+        self.file.flush()
+
+    def close(self):
+        Sink.close(self)
+        self.file.close()
+
+
+class SqliteSink(Sink):
+    '''
+    SQLite table with one column per field, each batch is inserted with executemany in one transaction. Keys
+    outside the fields are left out with a warning on stderr.
+    '''
+    def __init__(self, path, table='results', fields=None, batch_size=500):
+        Sink.__init__(self, batch_size)
+        self.table = table
+        self.fields = fields
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.insert = None
+
+    def writeBatch(self, records):
+        if self.insert is None:
+            self.fields = self.fields or list(records[0])
+            columns = ', '.join('"{0}"'.format(x) for x in self.fields)
+            self.db.execute('CREATE TABLE IF NOT EXISTS "{0}" ({1})'.format(self.table, columns))
+            self.insert = 'INSERT INTO "{0}" ({1}) VALUES ({2})'.format(self.table, columns, ', '.join('?' * len(self.fields)))
+        self.reportDropped(self.fields, records)
+        with self.db:
+            self.db.executemany(self.insert, [tuple(cell(x.get(k)) for k in self.fields) for x in records])
+
+    def close(self):
+        Sink.close(self)
+        self.db.close()
+
+
+class ThreadedSink:
+    '''
+    Writes to another sink from a background thread. write() blocks once max_pending records are waiting,
+    which holds the crawl back until the sink catches up.
+    '''
+    def __init__(self, sink, max_pending=10000):
+        self.sink = sink
+        self.queue = queue.Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            try:
+                self.sink.write(record)
+                if self.queue.empty():
+                    self.sink.flush()
+            except Exception as e:
+                self.error = e
+
+    def write(self, record):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(record)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.sink.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def openSink(path, fields=None, batch_size=500):
+    '''
+    Picks the sink from the file extension: .csv, .db/.sqlite/.sqlite3, anything else (or '-') is JSON lines
+    '''
+    if path.endswith('.csv'):
+        return CsvSink(path, fields, batch_size)
+    if path.endswith(('.db', '.sqlite', '.sqlite3')):
+        return SqliteSink(path, fields=fields, batch_size=batch_size)
+    return JsonlSink(path, batch_size)
@@ -0,0 +1,52 @@
+'''
+Import-time report for tracking how long it takes to start a worker. Runs a fresh interpreter with
+python -X importtime, then prints the slowest imports and how long creating an Executive took.
+
+python startup.py [--json] [--top N]
+'''
+import json
+import os
+import subprocess
+import sys
+
+STARTUP_CODE = '''
+import time
+start = time.perf_counter()
+from executive import Executive
+imported = time.perf_counter()
+Executive()
+created = time.perf_counter()
+print((imported - start) * 1000, (created - imported) * 1000)
+'''
+
+
+def importReport(top=15):
+    '''
+    Returns the total time to import executive and build an Executive, plus the imports with the largest
+    cumulative time in milliseconds
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP_CODE], cwd=here,
+                             capture_output=True, text=True, check=True)
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports.append((name.strip(), int(cumulative_us) / 1000))
+    import_ms, create_ms = (float(x) for x in process.stdout.split())
+    imports.sort(key=lambda x: x[1], reverse=True)
+    return {'import_ms': round(import_ms, 2), 'create_ms': round(create_ms, 2), 'modules': len(imports),
+            'slowest': [{'module': name, 'cumulative_ms': ms} for name, ms in imports[:top]]}
+
+
+if __name__ == '__main__':
+    top = int(sys.argv[sys.argv.index('--top') + 1]) if '--top' in sys.argv else 15
+    report = importReport(top)
+    if '--json' in sys.argv:
+        print(json.dumps(report, indent=2))
+    else:
+        print('import executive: {0} ms, Executive(): {1} ms, {2} modules imported'.format(
+            report['import_ms'], report['create_ms'], report['modules']))
+        for x in report['slowest']:
+            print('{0:>10.2f} ms  {1}'.format(x['cumulative_ms'], x['module']))
@@ -0,0 +1,192 @@
+r'''
+Declarative extraction templates. A template names the fields to pull out of a page:
+
+    {'name': 'product',
+     'fields': {'title': {'tag': 'h1', 'attrs': {'class': 'title'}},
+                'price': {'css': 'div.buy span.price', 'post': ['collapse', 'number']},
+                'images': {'css': 'img.gallery', 'value': '@src', 'many': True},
+                'sku': {'regex': r'SKU:\s*(\w+)'}}}
+
+Each field has one of tag (with optional attrs, matched like find()), css (a soupsieve selector) or regex (run
+over the page text, the first group is the value when there is one). A regex next to tag or css is applied
+to the matched value instead. value is 'text' (default), 'html' or '@attribute', many collects every match
+instead of the first, post is a list of POST_PROCESSORS names or callables and default is used when nothing
+matched.
+
+compileTemplate() turns a template into matchers once, later calls with the same template get the compiled
+one back, and its extractor runs every field in the same single traversal as the other extractors.
+'''
+import json
+import re
+from extract import Extractor, PageText, fingerprint
+
+NUMBER = re.compile(r'-?\d[\d,]*(?:\.\d+)?|-?\.\d+')
+
+
+def parseNumber(value):
+    match = NUMBER.search(value)
+    if match is None:
+        return None
+    number = match.group(0).replace(',', '')
+    return float(number) if '.' in number else int(number)
+
+
+POST_PROCESSORS = {'strip': str.strip,
+                   'collapse': lambda value: ' '.join(value.split()),
+                   'lower': str.lower,
+                   'upper': str.upper,
+                   'int': int,
+                   'float': float,
+                   'number': parseNumber}
+
+compiled_templates = {}
+
+
+def compileTemplate(template):
+    '''
+    Returns the CompiledTemplate for a template dict (or a JSON string of one), compiling it only the first
+    time. Raises ValueError when a field is not valid.
+    '''
+    if isinstance(template, CompiledTemplate):
+        return template
+    if isinstance(template, str):
+        template = json.loads(template)
+    key = json.dumps(template, sort_keys=True, default=repr)
+    if key not in compiled_templates:
+        compiled_templates[key] = CompiledTemplate(template)
+    return compiled_templates[key]
+
+
+class Field:
+    '''
+    One compiled field of a template
+    '''
+    def __init__(self, name, spec):
+        self.name = name
+        kinds = [x for x in ('tag', 'css') if x in spec]
+        if len(kinds) > 1 or not (kinds or 'regex' in spec):
+            raise ValueError('Field {0} needs exactly one of tag or css, or a regex'.format(name))
+        self.matcher = None
+        self.spec = None
+        if 'tag' in spec:
+            from bs4 import SoupStrainer
+            self.spec = (spec['tag'], spec.get('attrs', {}))
+            self.matcher = SoupStrainer(*self.spec).search_tag
+        elif 'css' in spec:
+            import soupsieve
+            try:
+                self.matcher = soupsieve.compile(spec['css']).match
+            except soupsieve.SelectorSyntaxError as e:
+                raise ValueError('Field {0} has an invalid selector: {1}'.format(name, e))
+        try:
+            self.regex = re.compile(spec['regex']) if 'regex' in spec else None
+        except re.error as e:
+            raise ValueError('Field {0} has an invalid regex: {1}'.format(name, e))
+        self.value = spec.get('value', 'text')
+        if self.value not in ('text', 'html') and not self.value.startswith('@'):
+            raise ValueError('Field {0} has an unknown value {1!r}'.format(name, self.value))
+        self.many = spec.get('many', False)
+        self.default = spec.get('default')
+        self.post = []
+        for step in spec.get('post', []):
+            if callable(step):
+                self.post.append(step)
+            elif step in POST_PROCESSORS:
+                self.post.append(POST_PROCESSORS[step])
+            else:
+                raise ValueError('Field {0} has an unknown post processor {1!r}'.format(name, step))
+
+    def read(self, tag):
+        if self.value == 'text':
+            return tag.get_text()
+        if self.value == 'html':
+            return str(tag)
+        value = tag.get(self.value[1:])
+        return ' '.join(value) if isinstance(value, list) else value
+
+    def finish(self, values):
+        '''
+        Applies the regex and post processors to the raw values and returns the field's result
+        '''
+        results = []
+        for value in values:
+            if value is not None and self.regex is not None and self.matcher is not None:
+                match = self.regex.search(value)
+                value = None if match is None else match.group(1 if match.groups() else 0)
+            if value is None:
+                continue
+            try:
+                for step in self.post:
+                    value = step(value)
+            except (TypeError, ValueError, AttributeError):
+                continue
+            if value is not None:
+                results.append(value)
+        if self.many:
+            return results if results else ([] if self.default is None else self.default)
+        return results[0] if results else self.default
+
+
+class CompiledTemplate:
+    '''
+    A template with its fields compiled. strainers are the (name, attrs) specs to parse for, None when a css or
+    regex field needs the whole document.
+    '''
+    def __init__(self, template):
+        if not template.get('fields'):
+            raise ValueError('A template needs at least one field')
+        self.template = template
+        self.name = template.get('name', 'template')
+        # Editing a template changes its version, so cached results of the old one are not reused. Callables in
+        # post are only known by their repr, which changes between runs, so such templates are cached per run.
+        self.version = fingerprint(template)
+        self.fields = [Field(name, spec) for name, spec in template['fields'].items()]
+        self.tag_fields = [x for x in self.fields if x.matcher is not None]
+        self.text_fields = [x for x in self.fields if x.matcher is None]
+        if any(x.spec is None for x in self.fields):
+            self.strainers = None
+        else:
+            self.strainers = [x.spec for x in self.fields]
+
+    def extractor(self):
+        return TemplateExtractor(self)
+
+    def __reduce__(self):
+        # Process pool workers get the template itself and compile it once on their side
+        return compileTemplate, (self.template,)
+
+
+class TemplateExtractor(Extractor):
+    '''
+    Applies a CompiledTemplate while the engine walks the page. Fields that want one match stop being tried
+    once they have it, regex fields run over the page text once the walk is done.
+    '''
+    def __init__(self, template):
+        self.template = template
+        self.strainer = template.strainers
+        self.version = '3-' + template.version
+        self.pending = list(template.tag_fields)
+        self.values = {x.name: [] for x in template.fields}
+        self.page_text = PageText() if template.text_fields else None
+
+    def tag(self, tag):
+        if self.page_text is not None:
+            self.page_text.tag(tag)
+        for field in self.pending:
+            if field.matcher(tag):
+                self.values[field.name].append(field.read(tag))
+                if not field.many:
+                    self.pending = [x for x in self.pending if x is not field]
+
+    def text(self, string):
+        if self.page_text is not None:
+            self.page_text.text(string)
+
+    def result(self):
+        if self.page_text is not None:
+            for field in self.template.text_fields:
+                matches = self.page_text.matches(field.regex)
+                if not field.many:
+                    matches = matches[:1]
+                self.values[field.name] = [x.group(1 if x.groups() else 0) for offset, x in matches]
+        return {x.name: x.finish(self.values[x.name]) for x in self.template.fields}
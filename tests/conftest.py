@@ -0,0 +1,56 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def serve():
+    '''
+    Starts a local server for {path: body} where body is a str, bytes, (headers, bytes) or (status, headers,
+    bytes), or a callable that takes the request headers and returns one of those. Returns the base url and a
+    list that gets (path, time) for every request.
+    '''
+    servers = []
+
+    def start(pages):
+        requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests.append((self.path, time.monotonic()))
+                page = pages.get(self.path)
+                if callable(page):
+                    page = page(self.headers)
+                if page is None:
+                    page = (404, {}, b'')
+                elif not isinstance(page, tuple):
+                    page = (200, {}, page)
+                elif len(page) == 2:
+                    page = (200,) + page
+                status, headers, body = page
+                body = body.encode('utf-8') if isinstance(body, str) else body
+                self.send_response(status)
+                headers = dict({'Content-Type': 'text/html', 'Content-Length': str(len(body))}, **headers)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return 'http://127.0.0.1:{0}'.format(server.server_address[1]), requests
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
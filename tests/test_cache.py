@@ -0,0 +1,146 @@
+import itertools
+import os
+import sqlite3
+import pytest
+import cache as cache_module
+from cache import DocumentCache, HttpCache, ResultCache
+from fetch import CachingFetcher, Fetcher
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''
+    Makes time.time() count up by one a call, so used_at values never tie
+    '''
+    ticks = itertools.count(1)
+    monkeypatch.setattr(cache_module.time, 'time', lambda: float(next(ticks)))
+
+
+def usedAt(path, url):
+    db = sqlite3.connect(path)
+    try:
+        return db.execute('SELECT used_at FROM results WHERE url = ?', (url,)).fetchone()[0]
+    finally:
+        db.close()
+
+
+def test_result_cache_hits_write_used_at_in_batches(tmp_path, clock):
+    path = str(tmp_path / 'results.db')
+    results = ResultCache(path, flush_every=2, flush_seconds=3600)
+    results.put('http://a/', 'emails:1', 'd', {'emails': []})
+    results.put('http://b/', 'emails:1', 'd', {'emails': []})
+    stored = usedAt(path, 'http://a/')
+    assert results.get('http://a/', 'emails:1', 'd') == {'emails': []}
+    results.get('http://a/', 'emails:1', 'd')
+    assert usedAt(path, 'http://a/') == stored
+    results.get('http://b/', 'emails:1', 'd')
+    assert usedAt(path, 'http://a/') > stored
+    results.close()
+
+
+def test_result_cache_eviction_sees_unwritten_hits(tmp_path, clock):
+    results = ResultCache(str(tmp_path / 'results.db'), max_entries=10, flush_seconds=3600)
+    for page in 'abcdefghij':
+        results.put('http://{0}/'.format(page), 'emails:1', 'd', {})
+    results.get('http://a/', 'emails:1', 'd')
+    # One over the limit trims to 9 entries, dropping the two least recently used
+    results.put('http://k/', 'emails:1', 'd', {})
+    assert results.get('http://a/', 'emails:1', 'd') == {}
+    assert results.get('http://b/', 'emails:1', 'd') is None
+    assert results.get('http://c/', 'emails:1', 'd') is None
+    assert results.get('http://d/', 'emails:1', 'd') == {}
+    results.close()
+
+
+def test_document_cache_evicts_the_least_recently_used_entry():
+    documents = DocumentCache(max_entries=2)
+    documents.put('http://a/', 'A', 1)
+    documents.put('http://b/', 'B', 1)
+    assert documents.get('http://a/') == 'A'
+    documents.put('http://c/', 'C', 1)
+    assert documents.get('http://b/') is None
+    assert documents.get('http://a/') == 'A' and documents.get('http://c/') == 'C'
+
+
+def test_document_cache_expires_entries_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now[0])
+    documents = DocumentCache(ttl=10)
+    documents.put('http://a/', 'A', 1)
+    now[0] += 5
+    assert documents.get('http://a/') == 'A'
+    now[0] += 6
+    assert documents.get('http://a/') is None
+    assert len(documents) == 0
+
+
+def test_document_cache_keeps_within_its_byte_budget():
+    documents = DocumentCache(max_bytes=100)
+    documents.put('http://a/', 'A', 60)
+    documents.put('http://b/', 'B', 60)
+    assert documents.get('http://a/') is None and documents.get('http://b/') == 'B'
+    documents.put('http://c/', 'C', 200)
+    assert documents.get('http://c/') is None
+    assert documents.stats()['bytes'] == 60
+
+
+def test_document_cache_invalidate_drops_every_variant_of_a_url():
+    documents = DocumentCache()
+    documents.put('http://a/', 'tree', 1)
+    documents.put('http://a/', '<html>', 1, 'raw')
+    documents.put('http://b/', 'tree', 1)
+    documents.invalidate('http://a/')
+    assert documents.get('http://a/') is None and documents.get('http://a/', 'raw') is None
+    assert documents.get('http://b/') == 'tree'
+
+
+def cachingFetcher(tmp_path, max_bytes=1024 * 1024):
+    return CachingFetcher(Fetcher(), HttpCache(str(tmp_path / 'http'), max_bytes))
+
+
+def test_http_cache_serves_fresh_entries_without_a_request(serve, tmp_path):
+    base, requests = serve({'/page': ({'Cache-Control': 'max-age=60'}, 'fresh')})
+    fetcher = cachingFetcher(tmp_path)
+    assert fetcher.fetch(base + '/page') == b'fresh'
+    assert fetcher.fetch(base + '/page') == b'fresh'
+    # A new cache over the same directory picks the entry up from disk
+    assert cachingFetcher(tmp_path).fetch(base + '/page') == b'fresh'
+    assert len(requests) == 1
+
+
+def test_http_cache_revalidates_stale_entries_with_their_etag(serve, tmp_path):
+    sent = []
+
+    def page(headers):
+        sent.append(headers.get('If-None-Match'))
+        if headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, b''
+        return {'ETag': '"v1"', 'Cache-Control': 'no-cache'}, 'body v1'
+
+    base, requests = serve({'/page': page})
+    fetcher = cachingFetcher(tmp_path)
+    assert fetcher.fetch(base + '/page') == b'body v1'
+    assert fetcher.fetch(base + '/page') == b'body v1'
+    assert sent == [None, '"v1"']
+    assert fetcher.stats()['cache_revalidated'] == 1
+
+
+def test_http_cache_does_not_store_no_store_responses(serve, tmp_path):
+    base, requests = serve({'/page': ({'Cache-Control': 'no-store, max-age=60'}, 'secret')})
+    fetcher = cachingFetcher(tmp_path)
+    assert fetcher.fetch(base + '/page') == b'secret'
+    assert fetcher.fetch(base + '/page') == b'secret'
+    assert len(requests) == 2
+    assert os.listdir(str(tmp_path / 'http')) == []
+
+
+def test_http_cache_evicts_least_recently_used_bodies_over_max_bytes(serve, tmp_path):
+    base, requests = serve({'/a': ({'Cache-Control': 'max-age=60'}, 'a' * 100),
+                            '/b': ({'Cache-Control': 'max-age=60'}, 'b' * 100)})
+    fetcher = cachingFetcher(tmp_path, max_bytes=150)
+    fetcher.fetch(base + '/a')
+    fetcher.fetch(base + '/b')
+    assert fetcher.http_cache.total_bytes == 100
+    assert fetcher.http_cache.lookup(base + '/a') is None
+    assert fetcher.http_cache.lookup(base + '/b') is not None
+    assert len(os.listdir(str(tmp_path / 'http'))) == 2
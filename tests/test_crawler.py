@@ -0,0 +1,81 @@
+import pytest
+from crawler import BloomVisitedSet, Crawler
+from executive import Executive
+
+PAGES = {'/robots.txt': ({'Content-Type': 'text/plain'}, 'User-agent: *\nDisallow: /private\nCrawl-delay: 1\n'),
+         '/': '<html><body><a href="/a">a</a><a href="/private">private</a></body></html>',
+         '/a': '<html><body><p>Call 555-123-4567</p></body></html>',
+         '/private': '<html><body><a href="/secret">secret</a></body></html>',
+         '/secret': '<html><body>secret</body></html>'}
+
+
+@pytest.fixture
+def site(serve):
+    return serve(PAGES)
+
+
+def urls(start, stop):
+    return ['http://example.com/{0}'.format(x) for x in range(start, stop)]
+
+
+def test_bloom_visited_set_resumes_from_checkpoint(tmp_path):
+    path = str(tmp_path / 'visited.db')
+    visited = BloomVisitedSet(path, capacity=1000, batch_size=10)
+    assert all(visited.add(x) for x in urls(0, 20))
+    visited.close()
+
+    resumed = BloomVisitedSet(path, capacity=1000, batch_size=10)
+    assert len(resumed) == 20
+    assert not any(resumed.add(x) for x in urls(0, 20))
+    assert resumed.add('http://example.com/new')
+
+
+def test_bloom_visited_set_resumes_after_unclean_stop(tmp_path):
+    path = str(tmp_path / 'visited.db')
+    visited = BloomVisitedSet(path, capacity=1000, batch_size=10)
+    for x in urls(0, 20):
+        visited.add(x)
+    visited.checkpoint()
+    # 20 of these are flushed to SQLite by add() itself, the last 5 are still pending when the process dies
+    for x in urls(20, 45):
+        visited.add(x)
+    visited.db.close()
+
+    resumed = BloomVisitedSet(path, capacity=1000, batch_size=10)
+    assert not any(resumed.add(x) for x in urls(0, 40))
+    assert all(resumed.add(x) for x in urls(40, 45))
+    assert len(resumed) == 45
+
+
+def test_polite_crawl_skips_disallowed_pages_and_keeps_the_crawl_delay(site):
+    base, requests = site
+    crawler = Crawler(Executive(), max_depth=2)
+    results = {url: result for url, depth, result in crawler.run([base + '/'], ['getPhoneNumbers'], polite=True)}
+
+    assert results[base + '/private'] == {'skipped': 'disallowed by robots.txt'}
+    assert results[base + '/a']['getPhoneNumbers'] == ['555-123-4567']
+    # Links on a disallowed page are not followed, and it is never downloaded
+    assert base + '/secret' not in results
+    paths = [path for path, at in requests]
+    assert '/private' not in paths and '/secret' not in paths
+    # The first page goes out before robots.txt is known, the next one still waits for the crawl delay
+    pages = [at for path, at in requests if path != '/robots.txt']
+    assert paths.count('/robots.txt') == 1
+    assert len(pages) == 2 and pages[1] - pages[0] >= 1
+
+
+def test_polite_crawl_spaces_the_request_that_loaded_robots_txt(site):
+    base, requests = site
+    list(Executive().crawl([base + '/', base + '/a'], ['getTitle'], polite=True))
+    pages = [at for path, at in requests if path != '/robots.txt']
+    assert len(pages) == 2 and pages[1] - pages[0] >= 1
+
+
+def test_crawler_follows_only_anchor_and_area_links(serve):
+    base, requests = serve({'/': '<html><head><base href="/sub/"><link rel="alternate" href="/feed.xml"></head>'
+                                 '<body><a href="page">page</a><map><area href="/map"></map></body></html>',
+                            '/sub/page': '<html><body>page</body></html>',
+                            '/map': '<html><body>map</body></html>'})
+    crawled = [url for url, depth, result in Crawler(Executive(), max_depth=1).run([base + '/'], ['getTitle'])]
+    assert sorted(crawled) == [base + '/', base + '/map', base + '/sub/page']
+    assert sorted(path for path, at in requests) == ['/', '/map', '/sub/page']
@@ -0,0 +1,75 @@
+from executive import Executive
+
+
+class PageFetcher:
+    '''
+    Serves fixed pages and counts requests per url
+    '''
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = {}
+
+    def fetch(self, url):
+        self.requests[url] = self.requests.get(url, 0) + 1
+        return self.pages[url].encode('utf-8')
+
+    def stats(self):
+        return {}
+
+
+PAGE = '<html><head><title>Shop</title></head><body><h1>Widget</h1><h2>Sale</h2></body></html>'
+
+
+def test_result_cache_is_not_reused_after_a_template_changes(tmp_path):
+    executive = Executive(fetcher=PageFetcher({'http://shop/': PAGE}), result_cache_path=str(tmp_path / 'results.db'))
+    executive.addTemplate({'name': 'product', 'fields': {'heading': {'tag': 'h1'}}})
+    assert executive.extract('http://shop/', ['product']) == {'product': {'heading': 'Widget'}}
+
+    executive.addTemplate({'name': 'product', 'fields': {'heading': {'tag': 'h2'}}})
+    assert executive.extract('http://shop/', ['product']) == {'product': {'heading': 'Sale'}}
+
+
+JSON_LD_PAGE = ('<html><head><script type="application/ld+json; charset=utf-8">{"@type": "Product", "name": "Widget"}'
+                '</script></head><body><p>Mail shop@example.com</p></body></html>')
+
+
+def test_json_ld_after_a_full_parse_does_not_fetch_again():
+    fetcher = PageFetcher({'http://shop/': JSON_LD_PAGE})
+    executive = Executive(fetcher=fetcher)
+    assert executive.getEmails('http://shop/') == ['shop@example.com']
+    assert executive.getJsonLd('http://shop/') == [{'@type': 'Product', 'name': 'Widget'}]
+    assert fetcher.requests == {'http://shop/': 1}
+
+
+def test_json_ld_blocks_with_a_charset_survive_partial_parsing():
+    executive = Executive(fetcher=PageFetcher({'http://shop/': JSON_LD_PAGE}))
+    assert executive.extract('http://shop/', ['jsonld']) == {'jsonld': [{'@type': 'Product', 'name': 'Widget'}]}
+
+
+def test_result_cache_does_not_store_a_stale_tree_under_a_new_digest(tmp_path):
+    fetcher = PageFetcher({'http://shop/': '<p>old@example.com</p>'})
+    path = str(tmp_path / 'results.db')
+    executive = Executive(fetcher=fetcher, result_cache_path=path)
+    assert executive.extract('http://shop/', ['emails']) == {'emails': ['old@example.com']}
+
+    fetcher.pages['http://shop/'] = '<p>new@example.com</p>'
+    assert executive.extract('http://shop/', ['emails']) == {'emails': ['new@example.com']}
+    assert Executive(fetcher=fetcher, result_cache_path=path).extract('http://shop/', ['emails']) == \
+        {'emails': ['new@example.com']}
+
+
+def test_unreachable_pages_give_no_getter_errors_in_crawl(serve):
+    base, requests = serve({})
+    results = dict(Executive().crawl([base + '/missing.html'], max_workers=1))[base + '/missing.html']
+    assert results == {'getEmails': None, 'getPhoneNumbers': None, 'getLinks': None}
+
+
+def test_opengraph_and_microdata_getters_record_metrics():
+    page = ('<html><head><meta property="og:title" content="Widget"></head>'
+            '<body><div itemscope itemtype="https://schema.org/Product"><span itemprop="name">Widget</span></div>'
+            '</body></html>')
+    executive = Executive(fetcher=PageFetcher({'http://shop/': page}), metrics=True)
+    assert executive.getOpenGraph('http://shop/') == {'og:title': 'Widget'}
+    assert executive.getMicrodata('http://shop/')[0]['properties'] == {'name': 'Widget'}
+    stages = executive.metricsSnapshot()['stages']
+    assert 'extract.opengraph' in stages and 'extract.microdata' in stages
@@ -0,0 +1,56 @@
+from functools import partial
+from bs4 import BeautifulSoup
+from extract import ExtractionEngine, ContactScanner
+from templates import compileTemplate
+
+
+def contacts(markup):
+    soup = BeautifulSoup(markup, 'html.parser')
+    return ExtractionEngine({'contacts': ContactScanner}).run(soup)['contacts']
+
+
+def test_numbers_next_to_words_in_other_strings_are_found():
+    markup = '<li>Phone:<span>555-123-4567</span>Fax:<span>555-123-4568</span></li>'
+    assert contacts(markup)['phones'] == ['555-123-4567', '555-123-4568']
+
+
+def test_number_followed_by_an_inline_tag_is_found():
+    assert contacts('<p>555-123-4567</p><a>x</a>')['phones'] == ['555-123-4567']
+
+
+def test_email_and_number_in_adjacent_strings_are_both_found():
+    found = contacts('<span>a@b.com</span><span>555-123-4567</span>')
+    assert found == {'emails': ['a@b.com'], 'phones': ['555-123-4567']}
+
+
+def test_number_split_over_inline_tags_is_still_found():
+    assert contacts('<p>Call <b>555</b>-123-4567 today</p>')['phones'] == ['555-123-4567']
+
+
+def test_text_is_broken_where_blocks_end():
+    assert contacts('<head><title>Contact</title></head><body>jane@example.com</body>')['emails'] == ['jane@example.com']
+    assert contacts('<p>jane@example.com</p><a>x</a>')['emails'] == ['jane@example.com']
+    assert contacts('<div><p>Call</p>555-123-4567</div>')['phones'] == ['555-123-4567']
+
+
+def test_match_within_one_string_beats_a_longer_joined_one():
+    assert contacts('<span>jane@example.com</span><span>x</span>')['emails'] == ['jane@example.com']
+
+
+def test_sources_map_matches_back_to_their_strings():
+    soup = BeautifulSoup('<p>Call <b>555</b>-123-4567</p><a href="mailto:jane@example.com">mail</a>', 'html.parser')
+    found = ExtractionEngine({'contacts': partial(ContactScanner, sources=True)}).run(soup)['contacts']
+    assert [x.parent.name for x in found['sources']['555-123-4567']] == ['b', 'p']
+    assert [x.name for x in found['sources']['jane@example.com']] == ['a']
+
+
+def test_template_regex_fields_stop_at_strings():
+    template = compileTemplate({'name': 'product', 'fields': {'sku': {'regex': r'\b\d{4}\b', 'many': True}}})
+    soup = BeautifulSoup('<p>SKU<b>1234</b>Lot<b>5678</b></p>', 'html.parser')
+    assert ExtractionEngine({'product': template.extractor}).run(soup)['product'] == {'sku': ['1234', '5678']}
+
+
+def test_template_regex_fields_do_not_run_into_the_title():
+    template = compileTemplate({'name': 'page', 'fields': {'first': {'regex': r'\w+'}}})
+    soup = BeautifulSoup('<head><title>Shop</title></head><body>Widget</body>', 'html.parser')
+    assert ExtractionEngine({'page': template.extractor}).run(soup)['page'] == {'first': 'Shop'}
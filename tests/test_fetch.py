@@ -0,0 +1,85 @@
+import argparse
+import functools
+import gzip
+import json
+import zlib
+import pytest
+import main
+from executive import Executive
+from fetch import DEFAULT_HEADERS, Fetcher, ResponseTooLarge
+
+BIG_PAGE = '<html><head><title>Big</title></head><body>' + '<p>Call 555-123-4567</p>' * 250 + '</body></html>'
+BOMB = ({'Content-Encoding': 'gzip'}, gzip.compress(b'<html><body>' + b' ' * 10 * 1024 * 1024))
+
+
+@pytest.fixture
+def site(serve):
+    return serve({'/big': BIG_PAGE, '/bomb': BOMB})[0]
+
+
+def test_stream_aborts_on_content_length_over_max_bytes(site):
+    fetcher = Fetcher(max_bytes=1000, oversize='abort')
+    with pytest.raises(ResponseTooLarge):
+        fetcher.stream(site + '/big')
+
+
+def test_stream_contacts_reports_a_page_that_is_too_large(site, capsys):
+    executive = Executive(max_bytes=1000, oversize='abort')
+    assert executive.streamContacts(site + '/big') is None
+    assert 'The page was too large' in capsys.readouterr().out
+
+
+def test_stream_truncates_at_max_bytes(site):
+    fetcher = Fetcher(max_bytes=1000)
+    headers, chunks = fetcher.stream(site + '/big', chunk_size=512)
+    body = b''.join(chunks)
+    assert len(body) < len(BIG_PAGE)
+    assert fetcher.lastFetch()['truncated'] == 'body over max_bytes'
+
+
+def test_stream_caps_decompressed_output(site):
+    fetcher = Fetcher(max_decompressed_bytes=100000)
+    headers, chunks = fetcher.stream(site + '/bomb')
+    sizes = [len(x) for x in chunks]
+    assert sum(sizes) == 100000 and max(sizes) <= 100000
+    assert fetcher.lastFetch()['truncated'] == 'decompressed body over max_decompressed_bytes'
+
+
+def test_batch_output_shows_truncated_pages(site, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'Executive', functools.partial(Executive, max_bytes=1000))
+    urls = tmp_path / 'urls.txt'
+    urls.write_text(site + '/big\n')
+    output = tmp_path / 'out.jsonl'
+    main.batch(argparse.Namespace(batch=str(urls), extractors='title', template=None, output=str(output),
+                                  batch_size=0, workers=2, per_host=2, processes=0))
+    record = json.loads(output.read_text())
+    assert record['title'] == 'Big' and record['truncated'] == 'body over max_bytes'
+
+
+def negotiated(body, headers):
+    '''
+    Serves body gzip or deflate compressed when the client accepts it, like most servers
+    '''
+    accepted = headers.get('Accept-Encoding', '')
+    if 'gzip' in accepted:
+        return {'Content-Encoding': 'gzip'}, gzip.compress(body.encode('utf-8'))
+    if 'deflate' in accepted:
+        # Raw deflate without the zlib header, as some servers send it
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        return {'Content-Encoding': 'deflate'}, compressor.compress(body.encode('utf-8')) + compressor.flush()
+    return body
+
+
+@pytest.mark.parametrize('accept', ['gzip, deflate', 'deflate'])
+def test_fetcher_asks_for_compressed_bodies_and_decodes_them(serve, accept):
+    base = serve({'/big': functools.partial(negotiated, BIG_PAGE)})[0]
+    fetcher = Fetcher(headers=dict(DEFAULT_HEADERS, **{'Accept-Encoding': accept}))
+    assert fetcher.fetch(base + '/big') == BIG_PAGE.encode('utf-8')
+    assert fetcher.lastFetch()['raw_bytes'] < fetcher.lastFetch()['bytes']
+
+
+def test_default_headers_accept_gzip(serve):
+    base = serve({'/big': functools.partial(negotiated, BIG_PAGE)})[0]
+    fetcher = Fetcher()
+    assert fetcher.fetch(base + '/big') == BIG_PAGE.encode('utf-8')
+    assert fetcher.lastFetch()['raw_bytes'] < 1000
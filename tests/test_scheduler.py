@@ -0,0 +1,46 @@
+from urllib.error import HTTPError
+import pytest
+from fetch import Fetcher
+from scheduler import AdaptiveRateLimiter
+
+
+def test_rate_limiter_backs_off_on_429_and_recovers():
+    limiter = AdaptiveRateLimiter(initial_rate=4.0, increase=0.5, decrease=0.5)
+    limiter.record('http://a/', 429, 2)
+    assert limiter.rates() == {'http://a': 2.0}
+    assert 1.9 < limiter.wait('http://a/') <= 2
+    # Other hosts are not held back
+    assert limiter.wait('http://b/') == 0
+    limiter.record('http://a/', 200)
+    assert limiter.rates()['http://a'] == 2.5
+
+
+def test_rate_limiter_pauses_one_token_interval_without_retry_after():
+    limiter = AdaptiveRateLimiter(initial_rate=4.0, decrease=0.5)
+    limiter.record('http://a/', 503)
+    assert 0.4 < limiter.wait('http://a/') <= 0.5
+
+
+def test_fetcher_waits_out_retry_after_before_retrying(serve):
+    answers = iter([(429, {'Retry-After': '1'}, 'slow down')])
+
+    def page(headers):
+        return next(answers, 'ok')
+
+    base, requests = serve({'/page': page})
+    limiter = AdaptiveRateLimiter()
+    fetcher = Fetcher(limiter=limiter)
+    assert fetcher.fetch(base + '/page') == b'ok'
+    (first, first_at), (second, second_at) = requests
+    assert second_at - first_at >= 1
+    # Halved by the 429, then raised once by the 200
+    assert list(limiter.rates().values()) == [limiter.initial_rate * limiter.decrease + limiter.increase]
+
+
+def test_fetcher_gives_up_after_its_retries(serve):
+    base, requests = serve({'/page': (429, {'Retry-After': '0'}, 'slow down')})
+    fetcher = Fetcher(limiter=AdaptiveRateLimiter(), retries=2)
+    with pytest.raises(HTTPError) as raised:
+        fetcher.fetch(base + '/page')
+    assert raised.value.code == 429
+    assert len(requests) == 3
@@ -0,0 +1,23 @@
+import csv
+import sqlite3
+from sinks import CsvSink, SqliteSink
+
+
+def test_csv_sink_warns_about_keys_outside_its_columns(tmp_path, capsys):
+    path = str(tmp_path / 'out.csv')
+    with CsvSink(path) as sink:
+        sink.write({'url': 'a', 'emails': ['x@y.com']})
+        sink.write({'url': 'b', 'emails': [], 'errors': {'emails': 'boom'}})
+        sink.write({'url': 'c', 'errors': {}})
+    with open(path, newline='', encoding='utf-8') as f:
+        assert [row['url'] for row in csv.DictReader(f)] == ['a', 'b', 'c']
+    warnings = capsys.readouterr().err.splitlines()
+    assert len(warnings) == 1 and "'errors'" in warnings[0]
+
+
+def test_sqlite_sink_warns_about_keys_outside_its_columns(tmp_path, capsys):
+    path = str(tmp_path / 'out.db')
+    with SqliteSink(path, fields=['url', 'title']) as sink:
+        sink.write({'url': 'a', 'title': 'A', 'truncated': 'body over max_bytes'})
+    assert sqlite3.connect(path).execute('SELECT url, title FROM results').fetchall() == [('a', 'A')]
+    assert "'truncated'" in capsys.readouterr().err